@@ -8,12 +8,27 @@ handle conversion to concrete data structures.
 In addition, I have tried to keep everything purely functional
 wherever possible.
 '''
-from math import factorial
+from array import array
+from bisect import bisect_left
+from collections import Counter, deque, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from math import comb, gcd, isqrt, log
+from multiprocessing.connection import wait as wait_for_connections
+import cProfile
+import importlib
 import itertools as itools
 import functools as ftools
+import mmap
+import multiprocessing as mp
 import operator as op
+import os
+import pstats
+import json
 import random
+import statistics
 import time
+import tracemalloc
 
 
 #############################################################
@@ -25,22 +40,445 @@ groupby = itools.groupby
 reduce = ftools.reduce
 
 
+#############################################################
+# Tuning constants                                          #
+#############################################################
+# Number of odd values covered by a single sieve segment. 2^18 bytes keeps
+# each segment comfortably inside a typical L2 cache.
+SIEVE_SEGMENT_SIZE = 1 << 18
+
+# Largest bound the shared prime table may grow to. Requests above this are
+# answered directly from the segmented sieve rather than being cached.
+PRIME_CACHE_CEILING = 1 << 27
+
+# Values below this are answered from the shared prime table by primality_many
+BATCH_TABLE_BOUND = 1 << 24
+
+# Values below this are factorised using the smallest prime factor table
+SPF_TABLE_BOUND = 1 << 22
+
+# Largest dense table of Collatz chain lengths built by longest_collatz
+COLLATZ_TABLE_BOUND = 1 << 24
+
+
 #############################################################
 # Helpers for analysing the solutions themselves            #
 #############################################################
-def euler_solution(func):
+# Profilers run by euler_solution for each value of `profile`
+_PROFILE_MODES = {
+    'cpu': ('cpu',),
+    'memory': ('memory',),
+    'all': ('cpu', 'memory'),
+    '1': ('cpu', 'memory'),
+}
+
+
+def _profile_solution(func, args, kwargs, mode, artifacts):
+    '''
+    Run func under cProfile and/or tracemalloc (once for each profiler so
+    that they don't skew each other), writing the results to
+    artifacts/<function name>/ and returning the result of the last run.
+    The shared prime and SPF tables are dropped before each run so that
+    every profile sees the cost of building them.
+    '''
+    if mode not in _PROFILE_MODES:
+        raise ValueError(f'Unknown profile mode: {mode!r}')
+
+    out_dir = os.path.join(artifacts, func.__name__)
+    os.makedirs(out_dir, exist_ok=True)
+
+    if 'cpu' in _PROFILE_MODES[mode]:
+        _clear_shared_tables()
+        profiler = cProfile.Profile()
+        res = profiler.runcall(func, *args, **kwargs)
+        profiler.dump_stats(os.path.join(out_dir, 'profile.pstats'))
+        with open(os.path.join(out_dir, 'profile.txt'), 'w') as f:
+            stats = pstats.Stats(profiler, stream=f)
+            stats.sort_stats('cumulative').print_stats(30)
+        print(f'CPU profile written to {out_dir}')
+
+    if 'memory' in _PROFILE_MODES[mode]:
+        _clear_shared_tables()
+        tracemalloc.start()
+        try:
+            res = func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+        finally:
+            tracemalloc.stop()
+        with open(os.path.join(out_dir, 'memory.txt'), 'w') as f:
+            print(f'Peak traced memory: {peak} bytes', file=f)
+            print('Largest allocation sites still held on return:', file=f)
+            for stat in top:
+                print(stat, file=f)
+        print(f'Peak memory {peak / 2 ** 20:.2f} MiB, written to {out_dir}')
+
+    return res
+
+
+def euler_solution(func=None, *, profile=None, artifacts=None):
     '''
     Time the execution of a function and print its result.
+
+    Can also be applied as @euler_solution(profile=...) to profile the
+    solution with cProfile ('cpu'), tracemalloc ('memory') or both ('all').
+    The EULER_PROFILE environment variable sets the mode for any solution
+    that doesn't specify one. Profiles are written to
+    <artifacts>/<function name>/, where artifacts defaults to the
+    EULER_ARTIFACTS environment variable or 'artifacts'.
     '''
+    if func is None:
+        return ftools.partial(
+            euler_solution, profile=profile, artifacts=artifacts
+        )
+
+    @ftools.wraps(func)
     def wrapped(*args, **kwargs):
         print(func.__doc__)
-        s = time.time()
-        res = func(*args, **kwargs)
-        print('Execution took {0:.7f} seconds'.format(time.time() - s))
+        mode = profile or os.environ.get('EULER_PROFILE')
+        if mode:
+            out = artifacts or os.environ.get('EULER_ARTIFACTS', 'artifacts')
+            res = _profile_solution(func, args, kwargs, mode, out)
+        else:
+            s = time.perf_counter_ns()
+            res = func(*args, **kwargs)
+            elapsed = (time.perf_counter_ns() - s) / 1e9
+            print('Execution took {0:.7f} seconds'.format(elapsed))
         print(res)
+        return res
+    return wrapped
+
+
+# Two sided 95% critical values of Student's t distribution keyed by degrees
+# of freedom. Anything above the largest key uses the normal value of 1.96.
+_T_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365,
+    8: 2.306, 9: 2.262, 10: 2.228, 12: 2.179, 15: 2.131, 20: 2.086,
+    30: 2.042, 60: 2.000, 120: 1.980
+}
+
+
+def _t_95(dof):
+    '''
+    Conservative 95% t value: use the nearest tabulated dof at or below dof.
+    '''
+    return _T_95[max(k for k in _T_95 if k <= dof)] if dof <= 120 else 1.96
+
+
+def benchmark(func, args=(), warmup=2, min_runs=5, max_runs=1000,
+              max_seconds=10.0, rel_ci=0.02, cold=True):
+    '''
+    Repeatedly time func(*args) with perf_counter_ns and return a summary.
+
+    After `warmup` untimed calls the function is run until the 95%
+    confidence interval on the mean is within rel_ci of the mean (having
+    made at least min_runs timed calls), or until max_runs calls have been
+    made. max_seconds covers the warmup calls too and overrides both
+    warmup and min_runs, though at least one timed call is always made.
+    All times in the result are in nanoseconds.
+
+    With cold set, the shared prime, SPF and prime pair tables are dropped
+    (untimed) before every call so that each one pays for building them
+    rather than measuring a cache hit left by the previous call.
+    '''
+    deadline = time.perf_counter_ns() + int(max_seconds * 1e9)
+    for _ in range(warmup):
+        if time.perf_counter_ns() > deadline:
+            break
+        if cold:
+            _clear_shared_tables()
+        func(*args)
+
+    samples = []
+    while len(samples) < max_runs:
+        if cold:
+            _clear_shared_tables()
+        s = time.perf_counter_ns()
+        func(*args)
+        samples.append(time.perf_counter_ns() - s)
+
+        n = len(samples)
+        if time.perf_counter_ns() > deadline:
+            break
+        if n >= min_runs:
+            mean = statistics.fmean(samples)
+            ci = _t_95(n - 1) * statistics.stdev(samples) / n ** 0.5
+            if ci <= rel_ci * mean:
+                break
+
+    mean = statistics.fmean(samples)
+    stdev = statistics.stdev(samples) if len(samples) > 1 else 0.0
+    quartiles = statistics.quantiles(samples, n=4) if len(samples) > 1 \
+        else [samples[0]] * 3
+    return {
+        'runs': len(samples),
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': mean,
+        'stdev': stdev,
+        'iqr': quartiles[2] - quartiles[0],
+        'ci95': _t_95(len(samples) - 1) * stdev / len(samples) ** 0.5
+        if len(samples) > 1 else 0.0,
+    }
+
+
+def save_benchmarks(results, fname):
+    '''
+    Write a dict of {name: benchmark summary} to fname as JSON.
+    '''
+    with open(fname, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_benchmarks(fname):
+    '''
+    Read a dict of {name: benchmark summary} written by save_benchmarks.
+    '''
+    with open(fname) as f:
+        return json.load(f)
+
+
+def compare_benchmarks(baseline, current, threshold=0.05):
+    '''
+    Compare two dicts of benchmark summaries, yielding (name, ratio) for
+    every benchmark whose median has slowed down by more than threshold
+    and where the two 95% confidence intervals do not overlap.
+    '''
+    for name in sorted(set(baseline) & set(current)):
+        old, new = baseline[name], current[name]
+        ratio = new['median'] / old['median']
+        separated = new['mean'] - new['ci95'] > old['mean'] + old['ci95']
+        if ratio > 1 + threshold and separated:
+            yield name, ratio
+
+
+# The outcome of running a single solution with run_solutions. status is one
+# of 'ok', 'error', 'timeout' or 'crashed' and value is the repr of the
+# result (or of the exception raised). When benchmarking, value is the
+# summary dict returned by `benchmark`.
+SolutionResult = namedtuple('SolutionResult', 'name status value seconds')
+
+
+def _run_solution(module_name, name, args, conn, bench=None):
+    '''
+    Worker process body for run_solutions: call (or benchmark) the
+    undecorated solution and send (status, value, seconds) back down the
+    pipe.
+    '''
+    func = getattr(importlib.import_module(module_name), name)
+    func = getattr(func, '__wrapped__', func)
+    s = time.perf_counter()
+    try:
+        if bench is None:
+            status, value = 'ok', repr(func(*args))
+        else:
+            status, value = 'ok', benchmark(func, args, **bench)
+    except Exception as exc:
+        status, value = 'error', repr(exc)
+    conn.send((status, value, time.perf_counter() - s))
+    conn.close()
+
+
+def run_solutions(module_name, tasks, jobs=None, timeout=None, bench=None):
+    '''
+    Run (name, args) tasks from the named module with up to `jobs` running
+    at once, yielding a SolutionResult for each one as it completes.
+
+    Each task gets its own worker process so that a task running for longer
+    than `timeout` seconds can be terminated without affecting the others.
+    Passing a dict of `benchmark` keyword arguments as `bench` benchmarks
+    each task instead of calling it once.
+    '''
+    jobs = jobs or os.cpu_count()
+    pending = deque(tasks)
+    running = {}  # reader -> (name, process, start time)
+
+    while pending or running:
+        while pending and len(running) < jobs:
+            name, args = pending.popleft()
+            reader, writer = mp.Pipe(duplex=False)
+            proc = mp.Process(
+                target=_run_solution,
+                args=(module_name, name, tuple(args), writer, bench),
+                daemon=True
+            )
+            proc.start()
+            writer.close()
+            running[reader] = (name, proc, time.perf_counter())
+
+        wait_time = None
+        if timeout is not None:
+            first_start = min(start for _, _, start in running.values())
+            wait_time = max(0, first_start + timeout - time.perf_counter())
+
+        for reader in wait_for_connections(list(running), wait_time):
+            name, proc, start = running.pop(reader)
+            try:
+                status, value, seconds = reader.recv()
+            except EOFError:
+                # The worker died without reporting back
+                status, value = 'crashed', None
+                seconds = time.perf_counter() - start
+            reader.close()
+            proc.join()
+            yield SolutionResult(name, status, value, seconds)
+
+        if timeout is not None:
+            now = time.perf_counter()
+            for reader, (name, proc, start) in list(running.items()):
+                if now - start >= timeout:
+                    proc.terminate()
+                    proc.join()
+                    reader.close()
+                    del running[reader]
+                    yield SolutionResult(name, 'timeout', None, now - start)
+
+
+# State for the tasks run by _map_chunks (set per worker process)
+_worker_state = None
+
+
+def _set_worker_state(state):
+    '''
+    Pool initializer for _map_chunks workers.
+    '''
+    global _worker_state
+    _worker_state = state
+
+
+def _map_chunks(task, chunks, processes=None, state=None):
+    '''
+    Return [task(chunk) for chunk in chunks], spread over a process pool
+    when `processes` is given.
+
+    `state` (e.g. a table built once up front) is available to the task as
+    _worker_state. Pool workers are sent it once when they start rather
+    than with every chunk.
+    '''
+    if processes:
+        with ProcessPoolExecutor(
+            processes, initializer=_set_worker_state, initargs=(state,)
+        ) as pool:
+            return list(pool.map(task, chunks))
+
+    previous = _worker_state
+    _set_worker_state(state)
+    try:
+        return [task(chunk) for chunk in chunks]
+    finally:
+        _set_worker_state(previous)
+
+
+#############################################################
+# Instrumentation of the library primitives                 #
+#############################################################
+# Counters recorded while `instrumented` is active and None otherwise. The
+# hot paths only check this one global so they cost nothing when disabled.
+_counters = None
+_last_counters = Counter()
+
+# Primitives whose calls and cumulative time are recorded by `instrumented`
+_TIMED_PRIMITIVES = (
+    'primes_to_n', 'nth_prime', 'is_prime', 'probably_prime',
+    'primality_many', 'spf_table', 'p_factors', 'pollard_brent',
+)
+
+# (name, hit counters, miss counters) used to report hit ratios from `stats`
+_HIT_RATIOS = (
+    ('prime_cache', ('prime_cache.hits',),
+     ('prime_cache.misses', 'prime_cache.fallbacks')),
+    ('spf_table', ('spf_table.hits',), ('spf_table.misses',)),
+    ('probably_prime.prefilter',
+     ('probably_prime.table', 'probably_prime.trial'),
+     ('probably_prime.miller_rabin',)),
+)
+
+
+def _timed(name, func):
+    '''
+    Wrap func so that its calls and cumulative time are added to _counters.
+    '''
+    @ftools.wraps(func)
+    def wrapped(*args, **kwargs):
+        s = time.perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _counters[name + '.calls'] += 1
+            _counters[name + '.ns'] += time.perf_counter_ns() - s
     return wrapped
 
 
+@contextmanager
+def instrumented(*namespaces):
+    '''
+    Record work done by the core primitives for the duration of the block:
+
+        with instrumented(globals()):
+            euler10(2000000)
+        print(stats())
+
+    While active, the primitives in _TIMED_PRIMITIVES are replaced by timing
+    wrappers in this module and in any of the given namespaces (such as the
+    globals() of a module that did `from euler_lib import *`). Work done in
+    worker processes is not recorded.
+    '''
+    global _counters, _last_counters
+    if _counters is not None:
+        raise RuntimeError('instrumented blocks can not be nested')
+
+    _counters = Counter()
+    module = globals()
+    originals = {name: module[name] for name in _TIMED_PRIMITIVES}
+    patched = []
+    for name, func in originals.items():
+        wrapper = _timed(name, func)
+        for ns in (module,) + namespaces:
+            if ns.get(name) is func:
+                ns[name] = wrapper
+                patched.append((ns, name, func))
+    try:
+        yield
+    finally:
+        for ns, name, func in patched:
+            ns[name] = func
+        _last_counters, _counters = _counters, None
+
+
+def stats():
+    '''
+    Snapshot of the counters from the active (or most recent) instrumented
+    block: call counts and cumulative seconds for each timed primitive, the
+    raw event counters and the hit ratios of the shared tables and of the
+    probably_prime prefilter.
+    '''
+    counters = Counter(_counters if _counters is not None else _last_counters)
+
+    calls, seconds, events = {}, {}, {}
+    for key, value in counters.items():
+        name, _, kind = key.rpartition('.')
+        if kind == 'calls':
+            calls[name] = value
+        elif kind == 'ns':
+            seconds[name] = value / 1e9
+        else:
+            events[key] = value
+
+    hit_ratios = {}
+    for name, hits, misses in _HIT_RATIOS:
+        hit = sum(counters[k] for k in hits)
+        total = hit + sum(counters[k] for k in misses)
+        if total:
+            hit_ratios[name] = hit / total
+
+    return {
+        'calls': calls,
+        'seconds': seconds,
+        'counters': events,
+        'hit_ratios': hit_ratios,
+    }
+
+
 ###################################################
 # General purpose helpers for use with generators #
 ###################################################
@@ -102,35 +540,46 @@ def flatten(lst):
     return (element for element in sum(_list, []))
 
 
+def _check_window_size(size):
+    '''
+    Raise ValueError unless size is a usable window length (at least 1).
+    Shared by windowed and the rolling reducers.
+    '''
+    if size < 1:
+        raise ValueError(f'Window size must be at least 1, not {size}')
+
+
 def windowed(size, col):
     '''
     Yield a sliding series of iterables of length _size_ from a collection.
 
+    Each window is a lazy view into a ring buffer so sliding costs O(1) per
+    element, but a view is only valid until the next window is requested.
+    Use l_windowed (or copy the view) if the windows need to be kept.
+
     NOTE:
     - If the collection is a generator it will be drained by this
-    - yields [] if the supplied collection has less than _size_ elements
-    - keeps _size_ elements in memory at all times
+    - yields nothing if the supplied collection has less than _size_ elements
+    - keeps 2 * _size_ elements in memory at all times
+    - raises ValueError if _size_ is less than 1
     '''
+    _check_window_size(size)
     remaining = iter(col)
-    current_slice = list(take(size, remaining))
+    ring = list(itools.islice(remaining, size))
 
-    if len(current_slice) < size:
+    if len(ring) < size:
         return
-    else:
-        while True:
-            yield (elem for elem in current_slice)
 
-            try:
-                next_element = next(remaining)
-            except StopIteration:
-                return
+    # Every element is stored twice, _size_ apart, so that the current
+    # window is always the contiguous slice ring[pos:pos + size]
+    ring += ring
+    pos = 0
+    yield itools.islice(ring, pos, pos + size)
 
-            if next_element:
-                # Slide the window
-                current_slice = current_slice[1:] + [next_element]
-            else:
-                # We've reached the end so return
-                break
+    for element in remaining:
+        ring[pos] = ring[pos + size] = element
+        pos = pos + 1 if pos + 1 < size else 0
+        yield itools.islice(ring, pos, pos + size)
 
 
 def l_windowed(size, col):
@@ -138,219 +587,1993 @@ def l_windowed(size, col):
     A version of windowed that yields lists rather than generators
     '''
     for w in windowed(size, col):
-        yield [elem for elem in w]
+        yield list(w)
+
+
+def rolling_sum(size, col):
+    '''
+    Yield the sum of each window of length _size_ over a collection, updating
+    the total incrementally rather than re-summing every window.
+    '''
+    _check_window_size(size)
+    window = deque()
+    total = 0
+    for element in col:
+        window.append(element)
+        total += element
+        if len(window) > size:
+            total -= window.popleft()
+        if len(window) == size:
+            yield total
+
+
+def rolling_product(size, col):
+    '''
+    Yield the product of each window of length _size_ over a collection.
+
+    Zeros are counted rather than multiplied in so that the running product
+    of the non-zero elements can always be divided back out. Integer inputs
+    give exact integer products.
+    '''
+    _check_window_size(size)
+    window = deque()
+    product, zeros = 1, 0
+    for element in col:
+        window.append(element)
+        if element:
+            product *= element
+        else:
+            zeros += 1
+
+        if len(window) > size:
+            old = window.popleft()
+            if not old:
+                zeros -= 1
+            elif isinstance(product, int) and isinstance(old, int):
+                product //= old
+            else:
+                product /= old
+
+        if len(window) == size:
+            yield 0 if zeros else product
+
+
+def _rolling_extreme(size, col, better):
+    '''
+    Monotonic deque of (index, value) pairs: the front is always the best
+    value (according to `better`) in the current window.
+    '''
+    _check_window_size(size)
+    candidates = deque()
+    for ix, element in enumerate(col):
+        while candidates and not better(candidates[-1][1], element):
+            candidates.pop()
+        candidates.append((ix, element))
+        if candidates[0][0] <= ix - size:
+            candidates.popleft()
+        if ix >= size - 1:
+            yield candidates[0][1]
+
+
+def rolling_min(size, col):
+    '''
+    Yield the minimum of each window of length _size_ over a collection
+    in amortised O(1) per element.
+    '''
+    return _rolling_extreme(size, col, op.lt)
+
+
+def rolling_max(size, col):
+    '''
+    Yield the maximum of each window of length _size_ over a collection
+    in amortised O(1) per element.
+    '''
+    return _rolling_extreme(size, col, op.gt)
 
 
 ###################################################
-# Mathematical sequences and functions            #
+# Scanning digit streams                          #
 ###################################################
-def a_sum(a, n, d):
+# bytes.translate tables: drop everything that isn't an ASCII digit and map
+# ASCII digits to their values
+_NON_DIGITS = bytes(set(range(256)) - set(b'0123456789'))
+_DIGIT_VALUES = bytes.maketrans(b'0123456789', bytes(range(10)))
+
+
+def _largest_product_in(data, size):
     '''
-    Find the arithmetic sum of a series
+    Largest product of _size_ consecutive digits in a bytes-like object,
+    ignoring anything that isn't a digit.
     '''
-    return int((n / 2) * (2 * a * (n - 1) * d))
+    largest = 0
+    # Any window containing a 0 has product 0 so the zeros partition the
+    # input into runs that can be scanned with an exact rolling product
+    for run in bytes(data).translate(None, _NON_DIGITS).split(b'0'):
+        if len(run) >= size:
+            values = run.translate(_DIGIT_VALUES)
+            largest = max(largest, max(rolling_product(size, values)))
+    return largest
 
 
-def lazy_fibs():
+def largest_digit_product(size, digits):
     '''
-    Infinite Fibonacci generator
+    Largest product of _size_ consecutive digits in a string of digits
     '''
-    a, b = 1, 1
-    while True:
-        yield a
-        a, b = b, a + b
+    return _largest_product_in(str(digits).encode(), size)
 
 
-def lazy_primes():
+def _largest_file_product_in(fname, size, span):
     '''
-    An infinite generator of primes based on a sieve that stores each prime
-    indexed against its current greatest multiple.
+    Largest product of _size_ consecutive digits for the windows starting in
+    the span of bytes [start, end) of a file. Reading continues past `end`
+    until the windows that straddle the boundary are complete.
     '''
-    sieve = {}
-    k = 2
-    while True:
-        # k_factors is a list of prime factors
-        # (not guaranteed to be all of the prime factors of k)
-        k_factors = sieve.get(k)
-        if k_factors:
-            # k is the current highest multiple of at least one prime
-            # stored in the sieve. Delete it from the sieve and move its
-            # prime factors to their next multiple.
-            del sieve[k]
-            for f in k_factors:
-                sieve.setdefault(f + k, []).append(f)
-        else:
-            # k is a prime so return it and mark its square in the sieve
-            # as the starting point for later filtering.
-            # - This is valid for all primes p as all multiples of p
-            #   below p^2 will be a composite pq where q is a prime
-            #   or composite less than p.
-            yield k
-            sieve[k ** 2] = [k]
-        k += 1
+    start, end = span
+    with open(fname, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            stop, overlap = end, 0
+            while overlap < size - 1 and stop < len(mm):
+                block = mm[stop:stop + 4096]
+                overlap += len(block.translate(None, _NON_DIGITS))
+                stop += len(block)
+            return _largest_product_in(mm[start:stop], size)
+
+
+def largest_file_digit_product(fname, size, processes=None,
+                               chunk_size=1 << 24):
+    '''
+    Largest product of _size_ consecutive digits in a file of digits (any
+    other bytes such as newlines are ignored).
+
+    The file is memory mapped and scanned in chunks of chunk_size bytes, so
+    memory use is bounded by the chunk size rather than by the file size.
+    Chunks overlap by enough digits to catch windows on the boundaries and
+    can be spread over a process pool.
+    '''
+    file_size = os.path.getsize(fname)
+    if file_size == 0:
+        return 0
+
+    spans = [
+        (start, min(start + chunk_size, file_size))
+        for start in range(0, file_size, chunk_size)
+    ]
+    scan = ftools.partial(_largest_file_product_in, fname, size)
+    return max(_map_chunks(scan, spans, processes))
 
 
-def primes_to_n(n):
+###################################################
+# Summing streams of large integers               #
+###################################################
+# Strings longer than this are parsed in pieces: recent Pythons refuse to
+# convert very long strings to int in one go (sys.get_int_max_str_digits)
+_PARSE_PIECE = 4000
+
+
+def _parse_decimal(s):
     '''
-    All primes below n
+    int(s) for a (possibly very long) string of decimal digits, splitting it
+    in half recursively so that each int() call stays short.
     '''
-    primes = lazy_primes()
-    p = next(primes)
-
-    while p < n:
-        yield p
-        p = next(primes)
+    if len(s) <= _PARSE_PIECE:
+        return int(s)
+    mid = len(s) // 2
+    low = s[mid:]
+    return _parse_decimal(s[:mid]) * 10 ** len(low) + _parse_decimal(low)
 
 
-def p_factors(n):
+def _decimal_length(n):
     '''
-    Find the prime factors of a number
+    Number of decimal digits in a positive int without converting to str
     '''
-    # Only need the primes up to sqrt(n) for factorisation.
-    factors = []
-    for p in primes_to_n(int(n ** 0.5) + 1):
-        while n % p == 0:
-            factors.append(p)
-            n /= p
-    # The final factor may be above sqrt(n) so we need to add it back
-    # Or, n is evenly divided by the factors so far so ignore '1'.
-    if n != 1:
-        factors.append(int(n))
-    return factors
+    length = max(int(n.bit_length() * 0.30102999566398120), 1)
+    while 10 ** length <= n:
+        length += 1
+    while length > 1 and 10 ** (length - 1) > n:
+        length -= 1
+    return length
 
 
-def probably_prime(n, k=20):
-    """
-    Check n for primalty using the Miller-Rabin method
-        https://en.wikipedia.org/wiki/Miller%E2%80%93Rabin_primality_test
-        http://mathworld.wolfram.com/Rabin-MillerStrongPseudoprimeTest.html
+def _leading_digits(n, digits):
+    '''
+    The first _digits_ digits of a non-negative int as a string
+    '''
+    length = _decimal_length(n) if n else 1
+    return str(n // 10 ** max(length - digits, 0))
 
-    Return True if n passes k rounds of the Miller-Rabin primality test (and is
-    probably prime). Return False if n is proved to be composite.
 
-    NOTE: This is faster than generating primes >= n and checking if we are in
-          the list but it is slower at generating a list of primes than
-          using `lazy_primes`.
-    """
-    small_primes = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31]
+def _pairwise_sum(values):
+    '''
+    Sum a list of ints as a balanced tree so that each addition is between
+    numbers of a similar size.
+    '''
+    values = list(values) or [0]
+    while len(values) > 1:
+        paired = [a + b for a, b in zip(values[::2], values[1::2])]
+        if len(values) % 2:
+            paired.append(values[-1])
+        values = paired
+    return values[0]
 
-    # Handle simple known cases
-    if n < 2:
-        return False
 
-    # Quick & small prime sieve for known small primes
-    for p in small_primes:
-        if n < p * p:
-            return True
+def read_lines(fname, chunk_size=1 << 22):
+    '''
+    Yield the stripped, non-empty lines of a file, reading roughly
+    chunk_size bytes of lines at a time.
+    '''
+    with open(fname) as f:
+        while True:
+            lines = f.readlines(chunk_size)
+            if not lines:
+                return
+            for line in lines:
+                line = line.strip()
+                if line:
+                    yield line
 
-        if n % p == 0:
-            return False
 
-    # Not sieved by the small primes so run Miller-Rabin
+def sum_big_ints(lines, batch_size=1 << 12):
+    '''
+    Exact sum of an iterable of non-negative decimal strings.
 
-    # Determine the values of r and s such that n == (2^r)s + 1
-    r, s = 0, n - 1
+    Lines are parsed batch_size at a time and each batch is summed as a
+    balanced tree before being added to the running total, so memory use is
+    bounded by one batch no matter how long the input is.
+    '''
+    total = 0
+    lines = iter(lines)
+    while True:
+        batch = list(itools.islice(lines, batch_size))
+        if not batch:
+            return total
+        total += _pairwise_sum(map(_parse_decimal, batch))
 
-    while s % 2 == 0:
-        r += 1
-        s //= 2
 
-    # Run our k iterations of the algorithm in different bases:
-    #   If a^s == 1 (mod n)
-    #   or a^2js == -1 (mod n) for some j, 0 <= j <= r-1
-    #   then n passes the test in base a.
-    #   A prime will pass in all bases. If the smallest known composite that
-    #   passes for a given base is known, then this can be used as a proof of
-    #   primality for all primes below that bound.
-    #   Using multiple tests of the first 7 primes are valid for every number
-    #   up to 3.4x10^14.
-    for _ in range(k):
-        # Select a base
-        a = random.randrange(2, n - 1)
-        x = pow(a, s, n)  # a^s (mod n)
-
-        if x == 1 or x == n - 1:
-            # We passed the first test in this base so don't bother
-            # with the second one.
-            continue
+def leading_digits_of_sum(lines, digits=10, guard=10):
+    '''
+    The first _digits_ digits (as a string) of the sum of an iterable of
+    non-negative, fixed width decimal strings.
+
+    Only the top digits + guard digits of each number are kept (aligned to
+    the width of the first line) so the running total stays small however
+    long the numbers are. Each truncation loses less than one unit in the
+    last kept place, so with N numbers the true (scaled) sum lies in
+    [total, total + N). If the leading digits differ across that range, a
+    carry may have been lost and ValueError is raised: use a larger guard.
+    '''
+    keep = digits + guard
+    lines = iter(lines)
+    first = next(lines, None)
+    if first is None:
+        return '0'
+
+    width = len(first)
+    drop = max(width - keep, 0)
+    total, count = 0, 0
+    for line in itools.chain([first], lines):
+        if len(line) > width:
+            raise ValueError('Numbers must not be wider than the first line')
+        cut = len(line) - drop
+        if cut > 0:
+            total += int(line[:cut])
+        count += 1
+
+    low = _leading_digits(total, digits)
+    if drop and _leading_digits(total + count - 1, digits) != low:
+        raise ValueError('Not enough guard digits to fix the leading digits')
+    return low
 
-        # Check for a passing value of j via repeated squaring. When we
-        # reach this point, x is already a^s (mod n).
-        for _ in range(r - 1):
-            x = pow(x, 2, n)
-            if x == n - 1:
-                break
-        else:
-            # Failed both tests so this is a composite
-            return False
 
-    # Passed both so this is _probably_ prime (known prime if we are below
-    # the threshold)
-    return True
+###################################################
+# Grids                                           #
+###################################################
+# A rectangular grid of ints stored row by row in a single flat array so that
+# rows, columns and diagonals can all be taken as (strided) slices.
+Grid = namedtuple('Grid', 'values rows cols')
 
 
-def n_digit_pals(n):
+def _grid_typecode(lo, hi):
     '''
-    Find all n-digit palindromes
+    The smallest array typecode that holds every value in [lo, hi]
     '''
-    def no_leading_0(n):
-        '''Check if a stringified number has a leading zero'''
-        return n[0] != '0'
+    for code in 'bBhHiIq':
+        bits = 8 * array(code).itemsize
+        signed = code.islower()
+        low = -(1 << (bits - 1)) if signed else 0
+        high = (1 << (bits - signed)) - 1
+        if low <= lo and hi <= high:
+            return code
+    raise OverflowError('Grid values do not fit in 64 bits')
 
-    digits = [str(n) for n in range(9, -1, -1)]
-    if n == 1:
-        for k in range(9, -1, -1):
-            yield k
-    elif n == 2:
-        for k in range(99, 0, -11):
-            yield k
-    else:
-        pals = (k + str(m) + k for k in digits for m in n_digit_pals(n - 2))
-        for k in map(int, filter(no_leading_0, pals)):
-            yield k
 
+def make_grid(matrix):
+    '''
+    Build a Grid from a sequence of equal length rows
+    '''
+    rows = [list(row) for row in matrix]
+    cols = len(rows[0]) if rows else 0
+    if any(len(row) != cols for row in rows):
+        raise ValueError('All rows of a grid must be the same length')
+    values = list(itools.chain.from_iterable(rows))
+    code = _grid_typecode(min(values, default=0), max(values, default=0))
+    return Grid(array(code, values), len(rows), cols)
 
-def largest_power_of_2(n):
-    '''Find the largest power of 2 less than n along with the power'''
-    res, power = 2, 1
-    while res <= n:
-        power += 1
-        res *= 2
-    return res // 2
 
+def load_grid(fname):
+    '''
+    Read a Grid of whitespace separated ints (one row per line) from a file.
 
-def powers_of_2(n):
-    '''Find all powers of 2 less than n and their power'''
-    res, power = 2, 1
-    powers = {2: 1}
-    while True:
-        power += 1
-        res *= 2
-        if res <= n:
-            powers[res] = power
+    The file is memory mapped and read twice, a line at a time: first to
+    find the shape and value range and then to fill an array of the
+    smallest suitable type, so no intermediate lists of the whole grid are
+    built.
+    '''
+    def lines(mm):
+        mm.seek(0)
+        for line in iter(mm.readline, b''):
+            if line.strip():
+                yield line.split()
+
+    with open(fname, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            rows, cols, lo, hi = 0, None, 0, 0
+            for line in lines(mm):
+                row = [int(v) for v in line]
+                if cols is None:
+                    cols = len(row)
+                elif len(row) != cols:
+                    raise ValueError(
+                        'All rows of a grid must be the same length'
+                    )
+                lo, hi = min(lo, *row), max(hi, *row)
+                rows += 1
+
+            values = array(_grid_typecode(lo, hi))
+            for line in lines(mm):
+                values.extend(map(int, line))
+
+    return Grid(values, rows, cols or 0)
+
+
+def _grid_line_starts(grid, k):
+    '''
+    (start, step, length) for every row, column and diagonal of a grid that
+    is at least k long.
+    '''
+    R, C = grid.rows, grid.cols
+    spans = [(i * C, 1, C) for i in range(R)]
+    spans += [(j, C, R) for j in range(C)]
+    # Down and to the right, starting on the top row then the left column
+    spans += [(j, C + 1, min(R, C - j)) for j in range(C)]
+    spans += [(i * C, C + 1, min(R - i, C)) for i in range(1, R)]
+    # Down and to the left, starting on the top row then the right column
+    spans += [(j, C - 1, min(R, j + 1)) for j in range(C)]
+    spans += [(i * C + C - 1, C - 1, min(R - i, C)) for i in range(1, R)]
+    return [span for span in spans if span[2] >= k]
+
+
+def _largest_grid_product_in(spans, k):
+    '''
+    Largest product of k adjacent values along the given lines of the Grid
+    in _worker_state
+    '''
+    values = _worker_state.values
+    largest = None
+    for start, step, length in spans:
+        if length == 1:
+            line = values[start:start + 1]
         else:
-            break
-    return powers
+            line = values[start:start + (length - 1) * step + 1:step]
+        best = max(rolling_product(k, line))
+        largest = best if largest is None else max(largest, best)
+    return largest
 
 
-def nCr(n, r):
+def largest_grid_product(grid, k, processes=None, chunk_size=256):
     '''
-    Compute n chose r using binomial coefficients
+    Largest product of k adjacent values in a Grid along a row, column or
+    either diagonal. Returns None if no line is k long.
+
+    Every line is a single (strided) slice of the flat value array and is
+    scanned with an O(1) per step rolling product. Lines are handed out in
+    chunks of chunk_size, optionally over a process pool.
     '''
-    return factorial(n) / (factorial(r) * factorial(n - r))
+    spans = _grid_line_starts(grid, k)
+    chunks = [
+        spans[i:i + chunk_size] for i in range(0, len(spans), chunk_size)
+    ]
+    if not chunks:
+        return None
 
+    scan = ftools.partial(_largest_grid_product_in, k=k)
+    return max(_map_chunks(scan, chunks, processes, grid))
 
-def spiral_corners():
+
+###################################################
+# Mathematical sequences and functions            #
+###################################################
+def a_sum(a, n, d):
     '''
-    Yield the corners of a number spiral in layers. Each layer
-    after the first contains 4 corners.
+    Find the arithmetic sum of a series
     '''
-    n, step = 1, 1
+    return int((n / 2) * (2 * a * (n - 1) * d))
 
-    yield [n]
 
+def lazy_fibs():
+    '''
+    Infinite Fibonacci generator
+    '''
+    a, b = 1, 1
     while True:
-        layer = []
+        yield a
+        a, b = b, a + b
+
+
+# Tables of multiplicative functions returned by multiplicative_tables: the
+# number of divisors, sum of divisors, Euler's totient and the Mobius
+# function, each indexed by n.
+DivisorTables = namedtuple('DivisorTables', 'tau sigma phi mu')
+
+
+def multiplicative_tables(n):
+    '''
+    Compute tau (number of divisors), sigma (sum of divisors), phi (Euler's
+    totient) and mu (Mobius) for every value below n in a single pass of a
+    linear sieve, where each composite is visited exactly once: as i * p
+    for its smallest prime factor p.
+
+    Alongside the outputs the sieve tracks, for each value, the exponent of
+    its smallest prime, that prime power and the sum of the powers up to it
+    so that multiplying by the same prime again can be undone exactly.
+    '''
+    n = max(n, 2)
+    tau = array('I', [0]) * n
+    sigma = array('Q', [0]) * n
+    phi = array('Q', [0]) * n
+    mu = array('b', [0]) * n
+    tau[1] = sigma[1] = phi[1] = mu[1] = 1
+
+    smallest = array('I', [0]) * n  # smallest prime factor
+    exponent = array('B', [0]) * n  # its exponent
+    power = array('Q', [0]) * n     # p^exponent
+    power_sum = array('Q', [0]) * n  # 1 + p + ... + p^exponent
+    primes = []
+
+    for i in range(2, n):
+        if not smallest[i]:
+            primes.append(i)
+            smallest[i] = power[i] = i
+            exponent[i] = 1
+            tau[i] = 2
+            sigma[i] = power_sum[i] = i + 1
+            phi[i] = i - 1
+            mu[i] = -1
+
+        for p in primes:
+            j = i * p
+            if j >= n or p > smallest[i]:
+                break
+            smallest[j] = p
+
+            if p == smallest[i]:
+                # p already divides i: bump the exponent of p
+                e = exponent[i]
+                exponent[j] = e + 1
+                power[j] = power[i] * p
+                power_sum[j] = power_sum[i] + power[j]
+                tau[j] = tau[i] // (e + 1) * (e + 2)
+                sigma[j] = sigma[i] // power_sum[i] * power_sum[j]
+                phi[j] = phi[i] * p
+                mu[j] = 0
+            else:
+                # p is a new (smaller) prime factor so multiply through
+                exponent[j] = 1
+                power[j] = p
+                power_sum[j] = p + 1
+                tau[j] = tau[i] * 2
+                sigma[j] = sigma[i] * (p + 1)
+                phi[j] = phi[i] * (p - 1)
+                mu[j] = -mu[i]
+
+    return DivisorTables(tau, sigma, phi, mu)
+
+
+def _fib_pair(n, m=0):
+    '''
+    (F(n), F(n + 1)) by fast doubling, reduced mod m if m is non-zero:
+        F(2k) = F(k)(2F(k + 1) - F(k))
+        F(2k + 1) = F(k)^2 + F(k + 1)^2
+    '''
+    a, b = 0, 1
+    for bit in bin(n)[2:]:
+        c = a * (2 * b - a)
+        d = a * a + b * b
+        if m:
+            c, d = c % m, d % m
+        a, b = (d, (c + d) % m if m else c + d) if bit == '1' else (c, d)
+    return a, b
+
+
+def fib(n):
+    '''
+    The nth Fibonacci number (F(0) = 0, F(1) = F(2) = 1) in O(log n)
+    big-int multiplications. Raises ValueError for negative n.
+    '''
+    if n < 0:
+        raise ValueError('Fibonacci numbers are only defined for n >= 0')
+    # Only F(n) is needed from the final (and most expensive) doubling step
+    a, b = _fib_pair(n // 2)
+    return a * (2 * b - a) if n % 2 == 0 else a * a + b * b
+
+
+def fib_mod(n, m):
+    '''
+    The nth Fibonacci number modulo m. Raises ValueError for negative n.
+    '''
+    if n < 0:
+        raise ValueError('Fibonacci numbers are only defined for n >= 0')
+    return _fib_pair(n, m)[0] % m
+
+
+def _fib_index_below(n):
+    '''
+    The largest k with F(k) < n (for n > 1), estimated from Binet's formula
+    and then corrected exactly.
+    '''
+    phi = (1 + 5 ** 0.5) / 2
+    k = max(int((log(n) + log(5) / 2) / log(phi)), 1)
+    while fib(k) >= n:
+        k -= 1
+    while fib(k + 1) < n:
+        k += 1
+    return k
+
+
+def fibs_below(n):
+    '''
+    The Fibonacci numbers below n in the same order as lazy_fibs (1, 1, 2,
+    ...), stopping at an index computed up front rather than comparing
+    every term.
+    '''
+    if n <= 1:
+        return iter(())
+    return itools.islice(lazy_fibs(), _fib_index_below(n))
+
+
+def even_fib_sum(n):
+    '''
+    Sum of the even Fibonacci numbers below n.
+
+    Every third term, F(3k), is even and
+        F(3) + F(6) + ... + F(3K) = (F(3K + 2) - 1) / 2
+    '''
+    if n <= 2:
+        return 0
+    terms = _fib_index_below(n) // 3
+    return (fib(3 * terms + 2) - 1) // 2
+
+
+def collatz_lengths(n):
+    '''
+    Collatz chain lengths (counting both the start and the final 1) for every
+    value below n as an array('I'), with index 0 left as 0.
+
+    Each chain is only followed until it drops below its starting value, at
+    which point the rest of its length is already in the table. Values above
+    n that the chains pass through are never stored.
+    '''
+    lengths = array('I', bytes(4 * max(n, 0)))
+    if n > 1:
+        lengths[1] = 1
+
+    for start in range(2, n):
+        m, steps = start, 0
+        while m >= start:
+            if m & 1:
+                # 3m + 1 is always even so take both steps at once
+                m = (3 * m + 1) >> 1
+                steps += 2
+            else:
+                m >>= 1
+                steps += 1
+        lengths[start] = steps + lengths[m]
+
+    return lengths
+
+
+def _longest_collatz_in(span):
+    '''
+    (start, length) of the longest Collatz chain starting in the span
+    [lo, hi), using the table of chain lengths in _worker_state for
+    everything below its length.
+    '''
+    lo, hi = span
+    table = _worker_state
+    limit = len(table)
+    best = (0, 0)
+
+    for start in range(lo, hi):
+        m, steps = start, 0
+        while m >= limit:
+            if m & 1:
+                m = (3 * m + 1) >> 1
+                steps += 2
+            else:
+                m >>= 1
+                steps += 1
+        length = steps + table[m]
+        if length > best[1]:
+            best = (start, length)
+
+    return best
+
+
+def longest_collatz(bound, processes=None, chunk_size=1 << 16):
+    '''
+    Return (start, length) for the longest Collatz chain with a starting
+    value below bound (the smallest such start if there is a tie).
+
+    Only starts in [bound/2, bound) need checking as any smaller n is beaten
+    by 2n. A dense table of chain lengths up to COLLATZ_TABLE_BOUND is built
+    first and the remaining starts are walked until they drop into it, in
+    chunks that can be spread over a process pool.
+    '''
+    if bound <= 2:
+        return (1, 1) if bound == 2 else None
+
+    table = collatz_lengths(min(bound, COLLATZ_TABLE_BOUND))
+    lo = bound // 2
+    spans = [
+        (start, min(start + chunk_size, bound))
+        for start in range(lo, bound, chunk_size)
+    ]
+
+    results = _map_chunks(_longest_collatz_in, spans, processes, table)
+    # Chunks are in order so the first maximum is the smallest start
+    return max(results, key=lambda r: r[1])
+
+
+def lazy_primes():
+    '''
+    An infinite generator of primes based on a sieve that stores each prime
+    indexed against its current greatest multiple.
+    '''
+    sieve = {}
+    k = last = 2
+    while True:
+        # k_factors is a list of prime factors
+        # (not guaranteed to be all of the prime factors of k)
+        k_factors = sieve.get(k)
+        if k_factors:
+            # k is the current highest multiple of at least one prime
+            # stored in the sieve. Delete it from the sieve and move its
+            # prime factors to their next multiple.
+            del sieve[k]
+            for f in k_factors:
+                sieve.setdefault(f + k, []).append(f)
+        else:
+            # k is a prime so return it and mark its square in the sieve
+            # as the starting point for later filtering.
+            # - This is valid for all primes p as all multiples of p
+            #   below p^2 will be a composite pq where q is a prime
+            #   or composite less than p.
+            if _counters is not None:
+                _counters['lazy_primes.steps'] += k - last + 1
+                last = k + 1
+            yield k
+            sieve[k ** 2] = [k]
+        k += 1
+
+
+def _odd_sieve(n):
+    '''
+    Odds-only sieve of Eratosthenes: index i of the returned bytearray is
+    non-zero iff 2i + 1 is prime, covering all odd values below n.
+    '''
+    sieve = bytearray([1]) * (n // 2)
+    if sieve:
+        sieve[0] = 0  # 1 is not prime
+
+    for i in range(1, (isqrt(max(n - 1, 0)) - 1) // 2 + 1):
+        if sieve[i]:
+            p = 2 * i + 1
+            start = p * p // 2
+            sieve[start::p] = bytes(len(range(start, len(sieve), p)))
+
+    return sieve
+
+
+def _small_primes(n):
+    '''
+    All primes below n as a list. Used to seed the segmented sieve.
+    '''
+    if n <= 2:
+        return []
+    odd = itools.compress(range(1, n, 2), _odd_sieve(n))
+    return [2] + list(odd)
+
+
+def _sieve_segment(lo, hi, base_primes):
+    '''
+    Sieve the odd values in [lo, hi) using the odd primes in base_primes.
+    `lo` must be odd and base_primes must cover sqrt(hi). Index i of the
+    returned bytearray is non-zero iff lo + 2i is prime.
+    '''
+    size = (hi - lo + 1) // 2
+    segment = bytearray([1]) * size
+
+    for p in base_primes:
+        if p * p >= hi:
+            break
+        # First odd multiple of p in the segment that is at least p^2
+        start = max(p * p, -(-lo // p) * p)
+        if start % 2 == 0:
+            start += p
+        i = (start - lo) // 2
+        if i < size:
+            segment[i::p] = bytes((size - 1 - i) // p + 1)
+
+    return segment
+
+
+def _sieved_segments(n, base_primes, processes=None):
+    '''
+    Yield (lo, hi, segment) for consecutive odd segments covering [3, n).
+    With `processes` set, segments are sieved on a process pool while a
+    bounded number of results are kept in flight so output stays in order.
+    '''
+    step = 2 * SIEVE_SEGMENT_SIZE
+    spans = ((lo, min(lo + step, n)) for lo in range(3, n, step))
+
+    if not processes:
+        for lo, hi in spans:
+            yield lo, hi, _sieve_segment(lo, hi, base_primes)
+        return
+
+    with ProcessPoolExecutor(processes) as pool:
+        pending = deque()
+        for lo, hi in spans:
+            future = pool.submit(_sieve_segment, lo, hi, base_primes)
+            pending.append((lo, hi, future))
+            if len(pending) > 2 * processes:
+                lo, hi, future = pending.popleft()
+                yield lo, hi, future.result()
+
+        while pending:
+            lo, hi, future = pending.popleft()
+            yield lo, hi, future.result()
+
+
+def _sieve_primes_to_n(n, processes=None):
+    '''
+    Stream the primes below n from the segmented sieve without caching.
+    '''
+    if n <= 2:
+        return
+    yield 2
+
+    base_primes = _small_primes(isqrt(n - 1) + 1)[1:]
+    for lo, hi, segment in _sieved_segments(n, base_primes, processes):
+        yield from itools.compress(range(lo, hi, 2), segment)
+
+
+###################################################
+# Process wide prime table                        #
+###################################################
+# A single odds-only sieve and the primes it contains, shared by everything
+# in this module. `limit` is the exclusive upper bound covered so far.
+_prime_cache = {'limit': 0, 'sieve': bytearray(), 'primes': array('L')}
+
+
+def _grow_prime_cache(n):
+    '''
+    Make sure that the prime table covers every value below n, growing it by
+    (at least) doubling. Return False if n is above PRIME_CACHE_CEILING and
+    the caller needs to fall back to the sieve.
+    '''
+    if n <= _prime_cache['limit']:
+        if _counters is not None:
+            _counters['prime_cache.hits'] += 1
+        return True
+    if n > PRIME_CACHE_CEILING:
+        if _counters is not None:
+            _counters['prime_cache.fallbacks'] += 1
+        return False
+    if _counters is not None:
+        _counters['prime_cache.misses'] += 1
+
+    limit = max(n, 2 * _prime_cache['limit'], 1 << 16)
+    limit = min(limit, PRIME_CACHE_CEILING)
+    sieve = _odd_sieve(limit)
+    primes = array('L', [2])
+    primes.extend(itools.compress(range(1, limit, 2), sieve))
+
+    _prime_cache.update(limit=limit, sieve=sieve, primes=primes)
+    return True
+
+
+def clear_prime_cache():
+    '''
+    Drop the shared prime table, releasing its memory.
+    '''
+    _prime_cache.update(limit=0, sieve=bytearray(), primes=array('L'))
+
+
+def set_prime_cache_ceiling(n):
+    '''
+    Set the largest bound that the shared prime table may grow to. If the
+    current table is larger than the new ceiling it is evicted and will be
+    rebuilt on demand.
+    '''
+    global PRIME_CACHE_CEILING
+    PRIME_CACHE_CEILING = n
+    if _prime_cache['limit'] > n:
+        clear_prime_cache()
+
+
+def primes_to_n(n, processes=None):
+    '''
+    All primes below n
+
+    Served from the shared prime table when n is below PRIME_CACHE_CEILING,
+    otherwise streamed from an odds-only segmented sieve so that only the
+    base primes up to sqrt(n) and one cache sized segment are held in memory
+    at a time. Passing `processes` fans the sieve segments out over a process
+    pool.
+    '''
+    if _grow_prime_cache(n):
+        primes = _prime_cache['primes']
+        return itools.islice(primes, bisect_left(primes, n))
+    return _sieve_primes_to_n(n, processes)
+
+
+def nth_prime(k):
+    '''
+    Return the kth prime (counting from 1 so that nth_prime(1) == 2)
+    '''
+    if k < 1:
+        raise IndexError
+    # Rosser's bound: p_k < k(ln k + ln ln k) for k >= 6
+    bound = 15 if k < 6 else int(k * (log(k) + log(log(k)))) + 1
+
+    if _grow_prime_cache(bound):
+        return _prime_cache['primes'][k - 1]
+    return nth(k, _sieve_primes_to_n(bound))
+
+
+def is_prime(n):
+    '''
+    Check n for primality using the shared prime table when it already
+    covers n, or would only need to double (or reach its minimum size) to do
+    so. Anything further out goes to probably_prime: sieving up to n to
+    answer a single query costs far more than a Miller-Rabin test.
+    '''
+    if n < 3:
+        return n == 2
+    if not n & 1:
+        return False
+    reach = max(2 * _prime_cache['limit'], 1 << 16)
+    if n < reach and _grow_prime_cache(n + 1):
+        return bool(_prime_cache['sieve'][n >> 1])
+    return probably_prime(n)
+
+
+###################################################
+# Factorisation                                   #
+###################################################
+# A shared smallest prime factor table: table[k] is the smallest prime that
+# divides k for every k below `limit`.
+_spf_cache = {'limit': 0, 'table': array('I')}
+
+
+def _build_spf_table(limit):
+    '''
+    Build a smallest prime factor table covering every value below limit.
+    '''
+    table = array('I', range(limit))
+    # Marking multiples with the largest primes first means that each entry
+    # is left holding its smallest prime factor.
+    for p in reversed(_small_primes(isqrt(max(limit - 1, 0)) + 1)):
+        count = len(range(p * p, limit, p))
+        table[p * p::p] = array('I', [p]) * count
+    return table
+
+
+def _clear_shared_tables():
+    '''
+    Drop the shared prime table, SPF table and prime pair graph.
+    '''
+    clear_prime_cache()
+    _spf_cache.update(limit=0, table=array('I'))
+    clear_pair_graph_cache()
+
+
+def spf_table(n):
+    '''
+    Return a smallest prime factor table covering every value below n,
+    growing the shared table by (at least) doubling when needed.
+    '''
+    if _counters is not None:
+        hit = n <= _spf_cache['limit']
+        _counters['spf_table.hits' if hit else 'spf_table.misses'] += 1
+    if n > _spf_cache['limit']:
+        limit = max(n, 2 * _spf_cache['limit'], 1 << 16)
+        _spf_cache.update(limit=limit, table=_build_spf_table(limit))
+    return _spf_cache['table']
+
+
+def _spf_factors(n, table):
+    '''
+    Prime factors of n (in ascending order) read off from an SPF table.
+    '''
+    factors = []
+    while n > 1:
+        p = table[n]
+        factors.append(p)
+        n //= p
+    return factors
+
+
+def pollard_brent(n):
+    '''
+    Find a non-trivial factor of a composite n using Brent's variant of
+    Pollard's rho algorithm.
+        https://en.wikipedia.org/wiki/Pollard%27s_rho_algorithm
+        Brent, "An improved Monte Carlo factorization algorithm" (1980)
+
+    The differences |x - y| are multiplied together (mod n) in batches so
+    that only one gcd is needed per batch. The polynomial x^2 + c is tried
+    with c = 1, 2, 3... so results are reproducible.
+    '''
+    if n % 2 == 0:
+        return 2
+
+    batch = 128
+    for c in itools.count(1):
+        y, r, q, g = 2, 1, 1, 1
+
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % n
+
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for _ in range(min(batch, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = gcd(q, n)
+                k += batch
+            r *= 2
+
+        if g == n:
+            # The batch overshot so step through it one gcd at a time
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = gcd(abs(x - ys), n)
+
+        if g != n:
+            return g
+
+
+def _iroot(n, k):
+    '''
+    The integer part of the kth root of n, using Newton's method.
+    '''
+    x = 1 << -(-n.bit_length() // k)  # An over estimate
+    while True:
+        y = ((k - 1) * x + n // x ** (k - 1)) // k
+        if y >= x:
+            return x
+        x = y
+
+
+def _perfect_power(n):
+    '''
+    Return (root, k) with root^k == n and k as large as possible. Only
+    called on values with no prime factors below 1000 so k is bounded by
+    log_1000(n).
+    '''
+    for k in range(n.bit_length() // 9, 1, -1):
+        root = _iroot(n, k)
+        if root ** k == n:
+            return root, k
+    return n, 1
+
+
+def p_factors(n):
+    '''
+    Find the prime factors of a number
+
+    Anything below SPF_TABLE_BOUND is factorised with O(log n) lookups in the
+    smallest prime factor table. Larger values are trial divided by the
+    primes below 1000 and whatever remains is split with Pollard-Brent until
+    every piece passes the (deterministic) probably_prime test.
+    '''
+    if 1 < n < SPF_TABLE_BOUND:
+        return _spf_factors(n, spf_table(n + 1))
+    if n < 2:
+        return [] if n == 1 else [n]
+
+    factors = []
+    for tried, p in enumerate(_TRIAL_DIVISOR_LIST, 1):
+        if p * p > n:
+            break
+        while n % p == 0:
+            factors.append(p)
+            n //= p
+    if _counters is not None:
+        _counters['p_factors.divisions'] += tried + len(factors)
+
+    # Anything left over has no factors below 1000
+    unsplit = [n] if n != 1 else []
+    while unsplit:
+        m = unsplit.pop()
+        if probably_prime(m):
+            factors.append(m)
+            continue
+        if _counters is not None:
+            _counters['p_factors.splits'] += 1
+
+        # Rho needs ~sqrt(p) steps to split p^k so pull out exact powers first
+        root, k = _perfect_power(m)
+        if k > 1:
+            unsplit.extend([root] * k)
+        else:
+            d = pollard_brent(m)
+            unsplit.extend([d, m // d])
+
+    return sorted(factors)
+
+
+def factorize_range(lo, hi):
+    '''
+    Yield (n, prime factors of n) for every n in [lo, hi)
+
+    Ranges below SPF_TABLE_BOUND are read from the smallest prime factor
+    table. Above that each segment of the range is sieved by the primes up
+    to sqrt(hi) so that every number is only divided by its actual factors.
+    Ranges that are short compared to sqrt(hi) are not worth generating the
+    base primes for, so each number is passed to p_factors instead.
+    '''
+    lo = max(lo, 1)
+
+    if hi <= SPF_TABLE_BOUND:
+        table = spf_table(hi)
+        for n in range(lo, hi):
+            yield n, _spf_factors(n, table)
+        return
+
+    if hi - lo < isqrt(hi - 1):
+        for n in range(lo, hi):
+            yield n, p_factors(n)
+        return
+
+    base_primes = list(primes_to_n(isqrt(hi - 1) + 1))
+    for start in range(lo, hi, SIEVE_SEGMENT_SIZE):
+        stop = min(start + SIEVE_SEGMENT_SIZE, hi)
+        rest = list(range(start, stop))
+        factors = [[] for _ in rest]
+
+        for p in base_primes:
+            if p * p >= stop:
+                break
+            for ix in range(-start % p, stop - start, p):
+                m = rest[ix]
+                while m % p == 0:
+                    factors[ix].append(p)
+                    m //= p
+                rest[ix] = m
+
+        # Whatever is left over is a single prime above sqrt(n)
+        for ix, m in enumerate(rest):
+            if m > 1:
+                factors[ix].append(m)
+            yield start + ix, factors[ix]
+
+
+# Primes used to cheaply weed out most composites before Miller-Rabin
+_TRIAL_PRIMES = (
+    2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41,
+    43, 47, 53, 59, 61, 67, 71, 73, 79, 83, 89, 97
+)
+
+# Every prime below _TRIAL_BOUND, used by p_factors for trial division and by
+# primality_many to trial divide with a gcd against their product. The cheap
+# gcd with the primes below 100 runs first as it removes most composites.
+_TRIAL_BOUND = 1000
+_TRIAL_DIVISOR_LIST = _small_primes(_TRIAL_BOUND)
+_TRIAL_DIVISORS = frozenset(_TRIAL_DIVISOR_LIST)
+_TRIAL_PRODUCT_LO = reduce(op.mul, _TRIAL_PRIMES)
+_TRIAL_PRODUCT_HI = reduce(op.mul, _TRIAL_DIVISORS - set(_TRIAL_PRIMES))
+
+# Pairs of (bound, bases) such that testing every base in the set is a proof
+# of primality for all n below the bound.
+#   https://miller-rabin.appspot.com
+#   Sorenson & Webster, "Strong pseudoprimes to twelve prime bases" (2015)
+_MR_WITNESSES = (
+    (2047, (2,)),
+    (1373653, (2, 3)),
+    (9080191, (31, 73)),
+    (25326001, (2, 3, 5)),
+    (3215031751, (2, 3, 5, 7)),
+    (4759123141, (2, 7, 61)),
+    (1122004669633, (2, 13, 23, 1662803)),
+    (2152302898747, (2, 3, 5, 7, 11)),
+    (3474749660383, (2, 3, 5, 7, 11, 13)),
+    (341550071728321, (2, 3, 5, 7, 11, 13, 17)),
+    (3825123056546413051, (2, 3, 5, 7, 11, 13, 17, 19, 23)),
+    (318665857834031151167461, (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37)),
+    (3317044064679887385961981,
+     (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)),
+)
+
+
+def _strong_probable_prime(n, a, r, s):
+    '''
+    Single round of Miller-Rabin in base a where n - 1 == (2^r)s with s odd:
+        If a^s == 1 (mod n)
+        or a^((2^j)s) == -1 (mod n) for some j, 0 <= j <= r-1
+        then n passes the test in base a.
+    '''
+    x = pow(a, s, n)  # a^s (mod n)
+    if x == 1 or x == n - 1:
+        return True
+
+    # Check for a passing value of j via repeated squaring
+    for _ in range(r - 1):
+        x = pow(x, 2, n)
+        if x == n - 1:
+            return True
+    return False
+
+
+def _jacobi(a, n):
+    '''
+    Jacobi symbol (a/n) for odd positive n
+    '''
+    a %= n
+    result = 1
+    while a:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def _strong_lucas_probable_prime(n):
+    '''
+    Strong Lucas probable prime test using Selfridge's parameters. Combined
+    with a base 2 strong probable prime test this is the Baillie-PSW test,
+    for which no counterexample is known.
+        https://en.wikipedia.org/wiki/Lucas_pseudoprime
+    '''
+    if isqrt(n) ** 2 == n:
+        # No suitable D exists for perfect squares
+        return False
+
+    # Find the first D in 5, -7, 9, -11, ... with (D/n) == -1
+    D = 5
+    while True:
+        j = _jacobi(D, n)
+        if j == -1:
+            break
+        if j == 0 and abs(D) != n:
+            return False
+        D = -D - 2 if D > 0 else -D + 2
+    P, Q = 1, (1 - D) // 4
+
+    # n + 1 == (2^s)d with d odd
+    d, s = n + 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+
+    # Compute U_d, V_d and Q^d (mod n) working along the bits of d
+    U, V, Qk = 1, P, Q
+    for bit in bin(d)[3:]:
+        U, V = U * V % n, (V * V - 2 * Qk) % n
+        Qk = Qk * Qk % n
+        if bit == '1':
+            U, V = P * U + V, D * U + P * V
+            # Halve (mod n), making the numerator even first
+            U = (U + n if U & 1 else U) // 2 % n
+            V = (V + n if V & 1 else V) // 2 % n
+            Qk = Qk * Q % n
+
+    if U == 0 or V == 0:
+        return True
+    for _ in range(s - 1):
+        V = (V * V - 2 * Qk) % n
+        if V == 0:
+            return True
+        Qk = Qk * Qk % n
+    return False
+
+
+def probably_prime(n, k=None):
+    """
+    Check n for primalty using the Miller-Rabin method
+        https://en.wikipedia.org/wiki/Miller%E2%80%93Rabin_primality_test
+        http://mathworld.wolfram.com/Rabin-MillerStrongPseudoprimeTest.html
+
+    Values covered by the shared prime table are looked up directly and
+    everything else is run through trial division by the primes below 100.
+
+    By default the test is deterministic: below 3.3x10^24 it uses a known
+    minimal set of witness bases (so the answer is exact) and above that it
+    uses the Baillie-PSW test. Passing k instead runs k rounds of the test in
+    random bases: return True if n passes them all (and is probably prime).
+    Return False if n is proved to be composite.
+
+    NOTE: This is faster than generating primes >= n and checking if we are in
+          the list but it is slower at generating a list of primes than
+          using `primes_to_n`.
+    """
+    # Handle simple known cases
+    if n < 2:
+        return False
+    if n < _prime_cache['limit']:
+        if _counters is not None:
+            _counters['probably_prime.table'] += 1
+        return n == 2 or bool(n & 1 and _prime_cache['sieve'][n >> 1])
+
+    # Quick trial division by known small primes
+    for p in _TRIAL_PRIMES:
+        if n < p * p or n % p == 0:
+            if _counters is not None:
+                _counters['probably_prime.trial'] += 1
+            return n < p * p
+
+    # Not sieved by the small primes so run Miller-Rabin
+    if _counters is not None:
+        _counters['probably_prime.miller_rabin'] += 1
+    return _miller_rabin(n, k)
+
+
+def _miller_rabin(n, k=None):
+    '''
+    The Miller-Rabin / Baillie-PSW stage of probably_prime for odd n with no
+    small prime factors.
+    '''
+    # Determine the values of r and s such that n == (2^r)s + 1
+    r, s = 0, n - 1
+
+    while s % 2 == 0:
+        r += 1
+        s //= 2
+
+    if k is not None:
+        bases = (random.randrange(2, n - 1) for _ in range(k))
+        return all(_strong_probable_prime(n, a, r, s) for a in bases)
+
+    for bound, bases in _MR_WITNESSES:
+        if n < bound:
+            # NOTE: n > 97^2 here so every base is a non-zero residue
+            return all(_strong_probable_prime(n, a, r, s) for a in bases)
+
+    # Beyond the known witness sets so fall back to Baillie-PSW
+    return (
+        _strong_probable_prime(n, 2, r, s) and
+        _strong_lucas_probable_prime(n)
+    )
+
+
+def _batch_is_prime(n):
+    '''
+    Primality test used by primality_many for values above the prime table:
+    trial divide with two gcds and then run Miller-Rabin.
+    '''
+    if gcd(n, _TRIAL_PRODUCT_LO) != 1 or gcd(n, _TRIAL_PRODUCT_HI) != 1:
+        return n in _TRIAL_DIVISORS
+    if n < _TRIAL_BOUND ** 2:
+        return True
+    return _miller_rabin(n)
+
+
+def _batch_is_prime_chunk(values):
+    '''
+    Run _batch_is_prime over a list of values (used as a pool task)
+    '''
+    return [_batch_is_prime(n) for n in values]
+
+
+def primality_many(values, processes=None, chunk_size=1 << 14):
+    '''
+    Test every value in an iterable for primality, returning a list of bools
+    in the same order.
+
+    Values are partitioned by size: anything below BATCH_TABLE_BOUND is
+    looked up in the shared prime table, larger values are trial divided by
+    taking their gcd with the product of the primes below 1000, and the
+    survivors are run through Miller-Rabin. The large values are processed
+    in chunks of chunk_size, optionally spread over a process pool.
+    '''
+    values = list(values)
+    results = [False] * len(values)
+
+    small = [n for n in values if n < BATCH_TABLE_BOUND]
+    if small:
+        _grow_prime_cache(max(small) + 1)
+    limit, sieve = _prime_cache['limit'], _prime_cache['sieve']
+
+    remaining = []
+    for ix, n in enumerate(values):
+        if n < 2:
+            continue
+        if n < limit:
+            results[ix] = n == 2 or bool(n & 1 and sieve[n >> 1])
+        else:
+            remaining.append(ix)
+
+    large = [values[ix] for ix in remaining]
+    chunks = [
+        large[i:i + chunk_size] for i in range(0, len(large), chunk_size)
+    ]
+    tested = _map_chunks(_batch_is_prime_chunk, chunks, processes)
+    tested = itools.chain.from_iterable(tested)
+
+    for ix, is_p in zip(remaining, tested):
+        results[ix] = is_p
+    return results
+
+
+###################################################
+# Prime generating quadratics                     #
+###################################################
+def _quadratic_run(a, b, n=0):
+    '''
+    Count the consecutive values of n (starting from the given n) for which
+    n^2 + an + b is prime, using the odds-only sieve in _worker_state where
+    it reaches.
+    '''
+    sieve = _worker_state
+    start = n
+    while True:
+        k = n * n + a * n + b
+        if k < 2 * len(sieve):
+            if not (k == 2 or k > 2 and k & 1 and sieve[k >> 1]):
+                return n - start
+        elif not probably_prime(k):
+            return n - start
+        n += 1
+
+
+def _odd_b_window(s, m):
+    '''
+    Byte j of the returned int is 1 iff (2j + 1) + s is prime, for each odd
+    b = 2j + 1 below 2m and even s. None if the window runs off the sieve.
+    '''
+    sieve = _worker_state
+    lo = s // 2
+    if lo + m > len(sieve):
+        return None
+    if lo >= 0:
+        return int.from_bytes(sieve[lo:lo + m], 'little')
+    if lo + m <= 0:
+        return 0
+    return int.from_bytes(sieve[:lo + m], 'little') << (-8 * lo)
+
+
+def _odd_a_run(a, m, odd_primes, target):
+    '''
+    (run, b) for the odd prime b below 2m giving the longest run with an odd
+    a, or None if no b gives a run longer than target. odd_primes is the
+    n = 0 window, which is the same for every a.
+
+    For odd a, n^2 + an is always even so the values for every odd b at once
+    are a single window of the odds-only sieve: the windows for n = 0, 1, ...
+    are ANDed together until no b survives. The window at n = target is
+    applied up front as any b that can beat target must survive it.
+    '''
+    mask = odd_primes & _odd_b_window(1 + a, m)
+    if target > 1:
+        window = _odd_b_window(target * target + a * target, m)
+        if window is not None:
+            mask &= window
+    if not mask:
+        return None
+
+    n = 2
+    while True:
+        window = _odd_b_window(n * n + a * n, m)
+        if window is None:
+            # Past the end of the sieve: finish each survivor on its own
+            runs = (
+                (n + _quadratic_run(a, 2 * j + 1, n), -(2 * j + 1))
+                for j in range(m) if mask >> (8 * j) & 1
+            )
+            run, b = max(runs)
+            return (run, -b) if run > target else None
+        if not mask & window:
+            break
+        mask &= window
+        n += 1
+
+    if n <= target:
+        return None
+    j = ((mask & -mask).bit_length() - 1) // 8
+    return (n, 2 * j + 1)
+
+
+def _quadratic_runs_in(span, bound, target=0):
+    '''
+    (run, a, b) for the longest run with a in the span [lo, hi) and prime b
+    up to bound, or None if nothing beats target.
+    '''
+    lo, hi = span
+    m = (bound + 1) // 2
+    odd_primes = _odd_b_window(0, m)
+    best = None
+    for a in range(lo, hi):
+        # b = 2 is the only even prime; with any other (odd) b, 1 + a + b
+        # must be an odd prime so a is odd, unless 1 + a + b == 2
+        candidates = [(_quadratic_run(a, 2), 2)] if bound >= 2 else []
+        if a & 1:
+            found = _odd_a_run(a, m, odd_primes, target)
+            if found:
+                candidates.append(found)
+        elif 3 <= 1 - a <= bound:
+            candidates.append((_quadratic_run(a, 1 - a), 1 - a))
+
+        for run, b in candidates:
+            if run > target:
+                target, best = run, (run, a, b)
+
+    return best
+
+
+def longest_quadratic_run(bound, processes=None, chunk_size=1 << 10):
+    '''
+    Return (a, b, run) for the quadratic n^2 + an + b with |a| < bound and
+    |b| <= bound that is prime for the longest run of consecutive n starting
+    from n = 0, or None if there is none. Ties go to the smallest a and then
+    the smallest b.
+
+    n = 0 forces b to be prime and n = 1 forces 1 + a + b to be prime, which
+    (bar b = 2) makes a odd. For each odd a every odd b is tested in one go
+    against windows of the shared prime table, which is grown to cover runs
+    of up to around 100 terms; longer runs fall back to probably_prime.
+    Chunks of a values can be spread over a process pool.
+    '''
+    if bound < 2:
+        return None
+
+    # Enough of the table for runs of ~100 terms, well past the best known
+    limit = min(128 * 128 + 129 * bound + 1, PRIME_CACHE_CEILING)
+    _grow_prime_cache(limit)
+    sieve = _prime_cache['sieve']
+    spans = [
+        (start, min(start + chunk_size, bound))
+        for start in range(1 - bound, bound, chunk_size)
+    ]
+
+    # The first chunk gives a run length for the others to beat
+    scan = ftools.partial(_quadratic_runs_in, bound=bound)
+    results = _map_chunks(scan, spans[:1], state=sieve)
+    if results[0]:
+        scan = ftools.partial(scan, target=results[0][0])
+    results += _map_chunks(scan, spans[1:], processes, sieve)
+
+    # Chunks are in order of a so the first maximum has the smallest a
+    results = [r for r in results if r]
+    if not results:
+        return None
+    run, a, b = max(results, key=lambda r: r[0])
+    return (a, b, run)
+
+
+###################################################
+# Prime pair graphs                               #
+###################################################
+# The largest prime pair graph built so far: primes below `limit` (other
+# than 2 and 5) and, for each, a bitset of the primes it pairs with.
+_pair_graph_cache = {'limit': 0, 'primes': [], 'adjacency': []}
+
+
+def _pair_edges(primes, shifts, new, batch_size=1 << 16, processes=None):
+    '''
+    Yield (i, j) for i < j, j >= new, where both concatenations of primes[i]
+    and primes[j] are prime. Each pair is only tested once, in batches run
+    through primality_many.
+
+    Unless one of them is 3, p and q must be congruent mod 3 as otherwise
+    pq = p + q = 0 (mod 3), so only those pairs are tested.
+    '''
+    pairs, values = [], []
+    for j in range(new, len(primes)):
+        q = primes[j]
+        for i in range(j):
+            p = primes[i]
+            if p % 3 != q % 3 and p != 3:
+                continue
+            pairs.append((i, j))
+            values.extend((p * shifts[j] + q, q * shifts[i] + p))
+
+        if len(values) >= batch_size or j == len(primes) - 1:
+            tested = primality_many(values, processes)
+            for ix, pair in enumerate(pairs):
+                if tested[2 * ix] and tested[2 * ix + 1]:
+                    yield pair
+            pairs, values = [], []
+
+
+def prime_pair_graph(bound, processes=None):
+    '''
+    Return (primes, adjacency) for the primes below bound that can be
+    concatenated with another prime in both orders to give a prime (2 and 5
+    never can). adjacency[i] is an int used as a bitset: bit j is set iff
+    primes[i] and primes[j] concatenate both ways.
+
+    The largest graph is kept between calls: a smaller bound is a prefix of
+    it and a larger one only tests the pairs involving the new primes.
+    '''
+    cache = _pair_graph_cache
+    if bound > cache['limit']:
+        primes = cache['primes']
+        adjacency = cache['adjacency']
+        new = len(primes)
+
+        primes.extend(
+            p for p in primes_to_n(bound, processes)
+            if p > cache['limit'] and p not in (2, 5)
+        )
+        adjacency.extend(0 for _ in range(new, len(primes)))
+        shifts = [10 ** len(str(p)) for p in primes]
+
+        for i, j in _pair_edges(primes, shifts, new, processes=processes):
+            adjacency[i] |= 1 << j
+            adjacency[j] |= 1 << i
+        cache['limit'] = bound
+
+    primes = cache['primes'][:bisect_left(cache['primes'], bound)]
+    mask = (1 << len(primes)) - 1
+    return primes, [bits & mask for bits in cache['adjacency'][:len(primes)]]
+
+
+def clear_pair_graph_cache():
+    '''
+    Drop the cached prime pair graph, releasing its memory.
+    '''
+    _pair_graph_cache.update(limit=0, primes=[], adjacency=[])
+
+
+def _extend_clique(members, total, candidates, k, best):
+    '''
+    Depth first branch and bound: extend a clique (a list of indices into
+    the (primes, adjacency) graph in _worker_state, in increasing order)
+    using the candidates bitset. Returns the (sum, members) of the cheapest
+    k-clique found that beats best.
+    '''
+    primes, adjacency = _worker_state
+    need = k - len(members)
+    if not need:
+        return (total, members)
+
+    while candidates:
+        low = candidates & -candidates
+        j = low.bit_length() - 1
+        # Candidates are increasing so nothing after j can do better
+        if total + primes[j] * need >= best[0]:
+            break
+        candidates ^= low
+
+        remaining = candidates & adjacency[j]
+        if bin(remaining).count('1') < need - 1:
+            continue
+        best = _extend_clique(
+            members + [j], total + primes[j], remaining, k, best
+        )
+
+    return best
+
+
+def _min_sum_cliques_from(roots, k, best=float('inf')):
+    '''
+    (sum, members) of the cheapest k-clique whose smallest member is one of
+    roots and whose sum is below best, or None.
+    '''
+    primes, adjacency = _worker_state
+    found = (best, None)
+    for i in roots:
+        if primes[i] * k >= found[0]:
+            break
+        higher = adjacency[i] >> (i + 1) << (i + 1)
+        found = _extend_clique([i], primes[i], higher, k, found)
+    return found if found[1] else None
+
+
+def min_sum_prime_clique(k, bound, processes=None, chunk_size=64):
+    '''
+    Return (sum, primes) for the set of k primes below bound with the
+    smallest sum in which every pair concatenates (both ways) to a prime,
+    or None if there is no such set.
+
+    Searches prime_pair_graph(bound) for k-cliques by extending from each
+    root in increasing order, pruning whenever the remaining candidates are
+    too few or too large to beat the best sum found. Chunks of roots can be
+    spread over a process pool.
+    '''
+    if k == 1:
+        return (2, [2]) if bound > 2 else None
+
+    graph = primes, adjacency = prime_pair_graph(bound, processes)
+    roots = range(len(primes))
+    chunks = [
+        roots[i:i + chunk_size] for i in range(0, len(roots), chunk_size)
+    ]
+    if not chunks:
+        return None
+
+    # The smallest roots come first and give a sum for the others to beat
+    search = ftools.partial(_min_sum_cliques_from, k=k)
+    results = _map_chunks(search, chunks[:1], state=graph)
+    if results[0]:
+        search = ftools.partial(search, best=results[0][0])
+    results += _map_chunks(search, chunks[1:], processes, graph)
+
+    results = [r for r in results if r]
+    if not results:
+        return None
+    total, members = min(results)
+    return (total, [primes[i] for i in members])
+
+
+###################################################
+# Prime permutation progressions                  #
+###################################################
+def _progressions_in(groups, k):
+    '''
+    Every k-term increasing arithmetic progression within each of a list of
+    sorted groups of numbers.
+
+    For each first term a, the second term b can only run up to the point
+    where the last term would pass the end of the group. The third terms
+    2b - a for all of those are looked up in a set of the members in one
+    go, so no pair of members is ever looped over in Python.
+    '''
+    found = []
+    for group in groups:
+        members = set(group)
+        last = group[-1]
+        for ix, a in enumerate(group):
+            end = bisect_left(group, a + (last - a) // (k - 1) + 1, ix + 1)
+            seconds = group[ix + 1:end]
+            if k == 2:
+                found.extend((a, b) for b in seconds)
+                continue
+
+            twice = map((-a).__add__, map((2).__mul__, seconds))
+            for c in sorted(members.intersection(twice)):
+                step = (c - a) // 2
+                if all(a + m * step in members for m in range(3, k)):
+                    found.append(tuple(range(a, a + k * step, step)))
+    return found
+
+
+def prime_permutation_progressions(d, k=3, processes=None,
+                                   chunk_size=256):
+    '''
+    All k-term increasing arithmetic progressions of d-digit primes whose
+    terms are digit permutations of one another, as a sorted list of
+    tuples. e.g. (1487, 4817, 8147) for d = 4.
+
+    Primes are grouped by digit_signature, which keeps digit multiplicity,
+    and groups with at least k members are searched in chunks of
+    chunk_size groups, optionally spread over a process pool.
+    '''
+    if k < 2:
+        raise ValueError('A progression needs at least two terms')
+
+    groups = {}
+    lo = 10 ** (d - 1)
+    for p in primes_to_n(10 ** d, processes):
+        if p >= lo:
+            groups.setdefault(digit_signature(p), []).append(p)
+
+    candidates = [g for g in groups.values() if len(g) >= k]
+    del groups
+    chunks = [
+        candidates[i:i + chunk_size]
+        for i in range(0, len(candidates), chunk_size)
+    ]
+
+    search = ftools.partial(_progressions_in, k=k)
+    found = _map_chunks(search, chunks, processes)
+    return sorted(itools.chain.from_iterable(found))
+
+
+def reverse_digits(n):
+    '''
+    Reverse the decimal digits of a non-negative int (trailing zeros are
+    dropped: 120 -> 21)
+    '''
+    reversed_n = 0
+    while n:
+        n, d = divmod(n, 10)
+        reversed_n = reversed_n * 10 + d
+    return reversed_n
+
+
+# Weight of each digit character in a digit_signature: digit d counts in
+# the 8 bit field at bit 8d
+_DIGIT_WEIGHTS = {str(d): 1 << (8 * d) for d in range(10)}
+
+
+def digit_signature(n):
+    '''
+    An int identifying the multiset of decimal digits of a non-negative int:
+    two numbers share a signature iff their digits are permutations of one
+    another (leading zeros are not counted).
+
+    The count of each digit is packed into an 8 bit field in a single pass
+    over the digits, with the number of digits above the fields. Numbers
+    with 256 or more digits could overflow a field so they get wider fields
+    with a marker bit above them, which keeps the two kinds apart.
+    '''
+    s = str(n)
+    if len(s) < 256:
+        return sum(map(_DIGIT_WEIGHTS.__getitem__, s)) | len(s) << 80
+
+    width = len(s).bit_length()
+    signature = 1 << (10 * width)
+    for shift, d in zip(range(0, 10 * width, width), '0123456789'):
+        signature |= s.count(d) << shift
+    return signature
+
+
+def powers_by_length(exponent, start=1):
+    '''
+    Yield (digits, bases) for each digit length in turn, where bases is the
+    range of integers (from start) whose exponent-th power has exactly that
+    many digits. Bases keep on coming, so stop iterating when done.
+    '''
+    base = max(start, 1)
+    digits = len(str(base ** exponent))
+    while True:
+        end = _iroot(10 ** digits - 1, exponent) + 1
+        yield digits, range(base, end)
+        base, digits = end, digits + 1
+
+
+def n_digit_pals(n):
+    '''
+    Find all n-digit palindromes (in descending order)
+
+    Each palindrome is built arithmetically from its first half so they can
+    be generated lazily from the largest down.
+    '''
+    if n == 1:
+        yield from range(9, -1, -1)
+        return
+
+    half_len = (n + 1) // 2
+    shift = 10 ** (n - half_len)
+    # For odd n the middle digit is not repeated
+    drop = 10 ** (n % 2)
+    for half in range(10 ** half_len - 1, 10 ** (half_len - 1) - 1, -1):
+        yield half * shift + reverse_digits(half // drop)
+
+
+def _even_pal_factors(p, n):
+    '''
+    Find n-digit a >= b with a * b == p, for a 2n-digit palindrome p.
+
+    Writing a = 10^n - x and b = 10^n - y gives
+        p = 10^2n - (x + y)10^n + xy
+    so the halves of p fix x + y and xy up to a carry m from the low half.
+    For each possible carry x and y are the roots of a quadratic, so only a
+    square root is needed rather than a search over divisors.
+    '''
+    base = 10 ** n
+    upper, lower = divmod(p, base)
+    max_offset = base - base // 10  # keeps b >= 10^(n-1)
+
+    m = 0
+    while True:
+        s = base - upper + m
+        disc = s * s - 4 * (lower + m * base)
+        if disc < 0 or s > 2 * max_offset:
+            # disc only gets smaller as m grows (until s is far too large)
+            return None
+        root = isqrt(disc)
+        if root * root == disc and (s - root) % 2 == 0:
+            x, y = (s - root) // 2, (s + root) // 2
+            if 1 <= x and y <= max_offset:
+                return base - x, base - y
+        m += 1
+
+
+def _pal_factors(p, n):
+    '''
+    Find n-digit a >= b with a * b == p by scanning the divisors allowed by
+    the bounds 10^(n-1) <= b <= a < 10^n.
+    '''
+    lo, hi = 10 ** (n - 1), 10 ** n - 1
+    for a in range(min(hi, p // lo), isqrt(p - 1), -1):
+        if p % a == 0:
+            return a, p // a
+    return None
+
+
+def largest_palindrome_product(n):
+    '''
+    Return (palindrome, a, b) for the largest palindrome that is a product
+    of two n-digit numbers a >= b, or None if there isn't one.
+
+    Palindromes are tried in descending order. A product of two n-digit
+    numbers has 2n or 2n - 1 digits; 2n-digit candidates are solved
+    directly (see _even_pal_factors) and 2n - 1 digit ones by a bounded
+    divisor scan.
+    '''
+    hi = 10 ** n - 1
+    for p in n_digit_pals(2 * n):
+        if p > hi * hi:
+            continue
+        factors = _even_pal_factors(p, n)
+        if factors:
+            return (p, *factors)
+
+    for p in n_digit_pals(2 * n - 1):
+        if p > hi * hi or p == 0:
+            continue
+        factors = _pal_factors(p, n)
+        if factors:
+            return (p, *factors)
+
+    return None
+
+
+def largest_power_of_2(n):
+    '''Find the largest power of 2 less than n along with the power'''
+    res, power = 2, 1
+    while res <= n:
+        power += 1
+        res *= 2
+    return res // 2
+
+
+def powers_of_2(n):
+    '''Find all powers of 2 less than n and their power'''
+    res, power = 2, 1
+    powers = {2: 1}
+    while True:
+        power += 1
+        res *= 2
+        if res <= n:
+            powers[res] = power
+        else:
+            break
+    return powers
+
+
+def _product_tree(values):
+    '''
+    Multiply a list of ints together pairwise so that the big
+    multiplications are between numbers of similar size.
+    '''
+    values = list(values) or [1]
+    while len(values) > 1:
+        paired = [a * b for a, b in zip(values[::2], values[1::2])]
+        if len(values) % 2:
+            paired.append(values[-1])
+        values = paired
+    return values[0]
+
+
+def _legendre(n, p):
+    '''
+    The exponent of the prime p in n! (Legendre's formula)
+    '''
+    exponent = 0
+    while n:
+        n //= p
+        exponent += n
+    return exponent
+
+
+def nCr(n, r):
+    '''
+    Compute n chose r exactly using binomial coefficients
+
+    When r is a small fraction of n, math.comb's multiplicative method wins
+    as it never looks at the primes up to n. Otherwise the prime
+    factorisation of n! / (r!(n - r)!) is found with Legendre's formula and
+    the prime powers are multiplied together with a product tree.
+    '''
+    if r < 0 or r > n:
+        return 0
+    r = min(r, n - r)
+    # Measured crossover: below about n / 64 sieving to n costs more than
+    # the O(r) multiplications it saves
+    if 64 * r < n:
+        return comb(n, r)
+
+    powers = []
+    root = isqrt(n)
+    for p in primes_to_n(n + 1):
+        if p > n - r:
+            # Every prime in (n - r, n] divides n! exactly once
+            powers.append(p)
+        elif p > n // 2:
+            # ...and those in (n/2, n - r] can't divide the result
+            continue
+        elif p > root:
+            # Only one power of p is at most n so the exponent is 0 or 1
+            if n // p - r // p - (n - r) // p:
+                powers.append(p)
+        else:
+            e = _legendre(n, p) - _legendre(r, p) - _legendre(n - r, p)
+            if e:
+                powers.append(p ** e)
+
+    return _product_tree(powers)
+
+
+@ftools.lru_cache(maxsize=128)
+def pascal_row(n):
+    '''
+    Row n of Pascal's triangle as a tuple (memoised for repeated queries)
+    '''
+    row = [1] * (n + 1)
+    for k in range(1, n // 2 + 1):
+        row[k] = row[n - k] = row[k - 1] * (n - k + 1) // k
+    return tuple(row)
+
+
+@ftools.lru_cache(maxsize=8)
+def _factorial_tables(p):
+    '''
+    k! and (k!)^-1 (mod p) for 0 <= k < p, for a prime p
+    '''
+    fact = array('Q', [1]) * p
+    for k in range(1, p):
+        fact[k] = fact[k - 1] * k % p
+    inv_fact = array('Q', [1]) * p
+    inv_fact[p - 1] = pow(fact[p - 1], p - 2, p)
+    for k in range(p - 1, 0, -1):
+        inv_fact[k - 1] = inv_fact[k] * k % p
+    return fact, inv_fact
+
+
+def nCr_mod_p(n, r, p):
+    '''
+    Compute n chose r modulo a prime p using Lucas' theorem: the result is
+    the product of the binomials of the base p digits of n and r. Factorial
+    and inverse factorial tables mod p are cached, so p should be small
+    enough for a table of p entries.
+    '''
+    if r < 0 or r > n:
+        return 0
+    fact, inv_fact = _factorial_tables(p)
+    res = 1
+    while n or r:
+        n, ni = divmod(n, p)
+        r, ri = divmod(r, p)
+        if ri > ni:
+            return 0
+        res = res * fact[ni] * inv_fact[ri] * inv_fact[ni - ri] % p
+    return res % p
+
+
+def spiral_corners():
+    '''
+    Yield the corners of a number spiral in layers. Each layer
+    after the first contains 4 corners.
+    '''
+    n, step = 1, 1
+
+    yield [n]
+
+    while True:
+        layer = []
 
         for i in range(4):
             n += step * 2
@@ -360,3 +2583,291 @@ def spiral_corners():
 
         # New layer so increase the step size
         step += 1
+
+
+###################################################
+# Poker hand evaluation                           #
+###################################################
+# Cards are written as a value followed by a suit, e.g. 'TH' or '5C'
+POKER_VALUES = '23456789TJQKA'
+POKER_SUITS = 'DCHS'
+
+# Each card is packed into one int: its value's prime in the low byte, a bit
+# for its suit in bits 12-15 and a bit for its value in bits 16-28. Products
+# of the primes identify the multiset of values in a hand.
+_POKER_PRIMES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+_POKER_CARDS = {
+    v + s: _POKER_PRIMES[i] | (1 << (12 + j)) | (1 << (16 + i))
+    for i, v in enumerate(POKER_VALUES)
+    for j, s in enumerate(POKER_SUITS)
+}
+
+
+def _poker_key(values, flush):
+    '''
+    Slow but obviously correct ranking of a hand (given as value indices)
+    used to build the lookup tables: (category, tie breakers).
+    '''
+    counts = Counter(values)
+    # Order by how many of each value there are and then by the value
+    order = sorted(counts, key=lambda v: (counts[v], v), reverse=True)
+    shape = sorted(counts.values(), reverse=True)
+
+    straight_high = None
+    if len(counts) == 5:
+        if order[0] - order[4] == 4:
+            straight_high = order[0]
+        elif order == [12, 3, 2, 1, 0]:
+            straight_high = 3  # A-2-3-4-5 counts as 5 high
+
+    if straight_high is not None:
+        return (8 if flush else 4, straight_high)
+    if flush:
+        return (5, *order)
+
+    category = {
+        (4, 1): 7, (3, 2): 6, (3, 1, 1): 3,
+        (2, 2, 1): 2, (2, 1, 1, 1): 1, (1, 1, 1, 1, 1): 0,
+    }[tuple(shape)]
+    return (category, *order)
+
+
+def _build_poker_tables():
+    '''
+    Rank every one of the 7462 distinct 5 card hands and index the ranks by
+    value bits (for flushes and hands with 5 distinct values) or by prime
+    product (for everything else).
+    '''
+    hands = []
+    for values in itools.combinations_with_replacement(range(13), 5):
+        if max(Counter(values).values()) > 4:
+            continue
+        hands.append((_poker_key(values, False), values, False))
+        if len(set(values)) == 5:
+            hands.append((_poker_key(values, True), values, True))
+    hands.sort()
+
+    flushes = array('H', bytes(2 << 13))
+    uniques = array('H', bytes(2 << 13))
+    products = {}
+    for rank, (_, values, flush) in enumerate(hands, 1):
+        bits = sum(1 << v for v in values)
+        if flush:
+            flushes[bits] = rank
+        elif len(set(values)) == 5:
+            uniques[bits] = rank
+        else:
+            products[reduce(op.mul, (_POKER_PRIMES[v] for v in values))] = rank
+
+    return flushes, uniques, products
+
+
+_POKER_FLUSHES, _POKER_UNIQUES, _POKER_PRODUCTS = _build_poker_tables()
+
+
+def _poker_rank_codes(c1, c2, c3, c4, c5):
+    '''
+    Rank a hand of 5 packed cards with at most two table lookups.
+    '''
+    bits = (c1 | c2 | c3 | c4 | c5) >> 16
+    if c1 & c2 & c3 & c4 & c5 & 0xF000:
+        return _POKER_FLUSHES[bits]
+    return _POKER_UNIQUES[bits] or _POKER_PRODUCTS[
+        (c1 & 0xFF) * (c2 & 0xFF) * (c3 & 0xFF) * (c4 & 0xFF) * (c5 & 0xFF)
+    ]
+
+
+def poker_hand_rank(cards):
+    '''
+    Rank a 5 card poker hand such as ['5H', '5C', '6S', '7S', 'KD'] as a
+    single int from 1 (7-5-4-3-2 off suit) to 7462 (a royal flush). Better
+    hands always have higher ranks and equal hands have equal ranks, so no
+    separate tie breaking is needed.
+    '''
+    return _poker_rank_codes(*(_POKER_CARDS[c] for c in cards))
+
+
+def score_poker_file(fname, chunk_size=1 << 22):
+    '''
+    Score a file where each line deals 10 cards: 5 to player 1 then 5 to
+    player 2. Returns (player 1 wins, player 2 wins, ties).
+
+    The file is read roughly chunk_size bytes of lines at a time.
+    '''
+    cards = _POKER_CARDS
+    rank = _poker_rank_codes
+    wins_1 = wins_2 = 0
+    deals = 0
+
+    with open(fname) as f:
+        while True:
+            lines = f.readlines(chunk_size)
+            if not lines:
+                break
+            for line in lines:
+                hand = line.split()
+                if not hand:
+                    continue
+                deals += 1
+                codes = [cards[c] for c in hand]
+                r1, r2 = rank(*codes[:5]), rank(*codes[5:])
+                if r1 > r2:
+                    wins_1 += 1
+                elif r2 > r1:
+                    wins_2 += 1
+
+    return wins_1, wins_2, deals - wins_1 - wins_2
+
+
+# Result of poker_equity: counts over all trials and the equity (the mean
+# share of the pot, with ties split) along with a 95% confidence interval.
+PokerEquity = namedtuple(
+    'PokerEquity', 'trials wins ties losses equity low high'
+)
+
+# poker_equity enumerates every deal rather than sampling when there are at
+# most this many of them
+EXHAUSTIVE_EQUITY_LIMIT = 1 << 21
+
+
+def _equity_counts(hero, deck, opponents, deals):
+    '''
+    Score an iterable of deals, each a tuple of extra cards: the cards that
+    complete the hero's hand followed by 5 cards for each opponent.
+    Returns [wins, ties, losses, sum of pot shares, sum of squared shares].
+    '''
+    rank = _poker_rank_codes
+    missing = 5 - len(hero)
+    wins = ties = losses = 0
+    shares = shares_sq = 0.0
+
+    for extra in deals:
+        hero_rank = rank(*hero, *extra[:missing])
+        best, tied = 0, 0
+        for i in range(missing, len(extra), 5):
+            r = rank(*extra[i:i + 5])
+            if r > best:
+                best, tied = r, 1
+            elif r == best:
+                tied += 1
+
+        if hero_rank > best:
+            wins += 1
+            shares += 1
+            shares_sq += 1
+        elif hero_rank == best:
+            ties += 1
+            share = 1 / (tied + 1)
+            shares += share
+            shares_sq += share * share
+        else:
+            losses += 1
+
+    return [wins, ties, losses, shares, shares_sq]
+
+
+def _random_deals(deck, needed, trials, seed):
+    '''
+    `trials` random deals of `needed` cards from deck using their own RNG
+    '''
+    rng = random.Random(seed)
+    return (rng.sample(deck, needed) for _ in range(trials))
+
+
+def _all_deals(deck, missing, opponents, first_level):
+    '''
+    Every deal (as a flat tuple) that starts with one of the combinations in
+    first_level: hero's missing cards if any, otherwise opponent 1's hand.
+    '''
+    levels = [5] * opponents
+    if missing:
+        levels = [missing] + levels
+
+    def extend(prefix, remaining, sizes):
+        if not sizes:
+            yield prefix
+            return
+        for combo in itools.combinations(remaining, sizes[0]):
+            rest = [c for c in remaining if c not in combo]
+            yield from extend(prefix + combo, rest, sizes[1:])
+
+    for combo in first_level:
+        rest = [c for c in deck if c not in combo]
+        yield from extend(combo, rest, levels[1:])
+
+
+def _equity_task(hero, deck, opponents, task):
+    '''
+    Pool task for poker_equity: ('random', seed, trials) or
+    ('exhaustive', first level combinations)
+    '''
+    missing = 5 - len(hero)
+    if task[0] == 'random':
+        _, seed, trials = task
+        deals = _random_deals(deck, missing + 5 * opponents, trials, seed)
+    else:
+        deals = _all_deals(deck, missing, opponents, task[1])
+    return _equity_counts(hero, deck, opponents, deals)
+
+
+def poker_equity(hand, opponents=1, dead=(), trials=None, processes=None,
+                 seed=0, chunk_size=1 << 15):
+    '''
+    How often does a (possibly partial) 5 card hand beat `opponents` random
+    5 card hands? Any missing cards in `hand` are dealt along with the
+    opponents' hands from a deck without `hand` and `dead` in it.
+
+    If trials is None and there are at most EXHAUSTIVE_EQUITY_LIMIT possible
+    deals then every one of them is scored and the result is exact.
+    Otherwise trials (default 10^5) random deals are sampled. Work is split
+    into tasks of about chunk_size deals that can be spread over a process
+    pool; each sampling task has its own RNG seeded from (seed, task index)
+    so results don't depend on the number of processes.
+    '''
+    known = list(hand) + list(dead)
+    if len(set(known)) != len(known):
+        raise ValueError('A card was given more than once')
+    if len(hand) > 5 or opponents < 1:
+        raise ValueError('Need at most 5 cards in hand and an opponent')
+
+    hero = [_POKER_CARDS[c] for c in hand]
+    deck = [code for c, code in _POKER_CARDS.items() if c not in known]
+    missing = 5 - len(hero)
+    if missing + 5 * opponents > len(deck):
+        raise ValueError('Not enough cards left to deal')
+
+    sizes = ([missing] if missing else []) + [5] * opponents
+    total, left = 1, len(deck)
+    for size in sizes:
+        total *= comb(left, size)
+        left -= size
+
+    if trials is None and total <= EXHAUSTIVE_EQUITY_LIMIT:
+        first_level = list(itools.combinations(deck, sizes[0]))
+        per_task = max(1, chunk_size * len(first_level) // total)
+        tasks = [
+            ('exhaustive', first_level[i:i + per_task])
+            for i in range(0, len(first_level), per_task)
+        ]
+    else:
+        trials = trials or 10 ** 5
+        tasks = [
+            ('random', f'{seed}:{ix}', min(chunk_size, trials - start))
+            for ix, start in enumerate(range(0, trials, chunk_size))
+        ]
+
+    run = ftools.partial(_equity_task, hero, deck, opponents)
+    results = _map_chunks(run, tasks, processes)
+
+    wins, ties, losses, shares, shares_sq = map(sum, zip(*results))
+    n = wins + ties + losses
+    equity = shares / n
+    if tasks[0][0] == 'exhaustive':
+        low = high = equity
+    else:
+        variance = max(shares_sq / n - equity ** 2, 0.0) * n / max(n - 1, 1)
+        half_width = 1.96 * (variance / n) ** 0.5
+        low = max(equity - half_width, 0.0)
+        high = min(equity + half_width, 1.0)
+
+    return PokerEquity(n, wins, ties, losses, equity, low, high)
@@ -2,8 +2,12 @@
 Solutions to the Project Euler Problems
 ```````````````````````````````````````
 '''
-from collections import defaultdict, namedtuple
-from itertools import combinations, groupby
+from collections import Counter
+import argparse
+import ast
+import inspect
+import re
+import sys
 
 from euler_lib import *
 from euler_lib import euler_solution
@@ -30,6 +34,20 @@ BIG_INT_PROBLEM_8 = (
     "882670428252483600823257530420752963450"
 )
 
+# Arguments used by the batch runner for problems that have no defaults
+DEFAULT_ARGS = {
+    1: (3, 5, 1000),
+    2: (4000000,),
+    3: (600851475143,),
+    4: (3,),
+    5: (20,),
+    6: (100,),
+    7: (10001,),
+    8: (13,),
+    9: (1000,),
+    10: (2000000,),
+}
+
 ###############################################################################
 
 
@@ -50,14 +68,7 @@ def euler2(n):
     '''
     Find the sum of even valued Fibonacci numbers below n
     '''
-    fib_sum = 0
-    fibs = lazy_fibs()
-    next_fib = next(fibs)
-    while next_fib < n:
-        if next_fib % 2 == 0:
-            fib_sum += next_fib
-        next_fib = next(fibs)
-    return fib_sum
+    return even_fib_sum(n)
 
 
 @euler_solution
@@ -74,26 +85,7 @@ def euler4(n):
     '''
     Find the largest palendromic product of two n-digit numbers
     '''
-    upper = 10 ** n
-    lower = 10 ** (n - 1)
-    step_size = min(1000, int(upper * 0.1))
-    amax = bmax = upper
-    amin = bmin = upper - step_size
-    stepped = False
-
-    while True:
-        prods = ((a * b, a, b) for a in range(amin, amax) for b in range(bmin, bmax))
-        palenprods = [p for p in prods if str(p[0]) == str(p[0])[::-1]]
-        if palenprods:
-            return max(palenprods)
-        else:
-            amin = amin if stepped else bmin
-            bmax = amin if stepped else bmax
-            bmin = bmin - step_size if stepped else bmin
-            stepped = not stepped
-            if bmin < lower:
-                # No solution in the required range
-                return None
+    return largest_palindrome_product(n)
 
 
 @euler_solution
@@ -102,8 +94,7 @@ def euler5(n):
     Find the smallest number that can be divided evenly by 1..n
     '''
     factmap = dict()
-    for i in range(1, n+1):
-        factors = p_factors(i)
+    for i, factors in factorize_range(1, n+1):
         for f in factors:
             freq = factors.count(f)
             previous = factmap.setdefault(f, 0)
@@ -130,29 +121,20 @@ def euler6(n):
 @euler_solution
 def euler7(n):
     '''Return the nth prime number'''
-    return nth(n, lazy_primes())
+    return nth_prime(n)
 
 
 @euler_solution
-def euler8(l, n=None):
-    '''Find the largest product of l consecutive digits in n'''
+def euler8(l, n=None, fname=None):
+    '''
+    Find the largest product of l consecutive digits in n (or in the digits
+    stored in the file fname)
+    '''
+    if fname:
+        return largest_file_digit_product(fname, l)
     if n:
-        n = str(n)
-    else:
-        n = BIG_INT_PROBLEM_8
-
-    # Any product containing 0 is 0 so this partitions our input
-    split_on_zero = n.split("0")
-    largest = 0
-    for fragment in split_on_zero:
-        if len(fragment) > l:
-            over_l = len(fragment) - l
-            for offset in range(over_l + 1):
-                product = 1
-                for index in range(l):
-                    product *= int(fragment[index + offset])
-                largest = max(product, largest)
-    return largest
+        return largest_digit_product(l, n)
+    return largest_digit_product(l, BIG_INT_PROBLEM_8)
 
 
 @euler_solution
@@ -192,11 +174,14 @@ def euler10(n):
     return sum(primes_to_n(n))
 
 
-def euler11(matrix):
+@euler_solution
+def euler11(matrix, k=4):
     '''
-    Find the largest product in a grid
+    Find the largest product of k adjacent numbers (in any direction) in a
+    grid, given as a list of rows or as the name of a file to load it from
     '''
-    pass
+    grid = load_grid(matrix) if isinstance(matrix, str) else make_grid(matrix)
+    return largest_grid_product(grid, k)
 
 
 @euler_solution
@@ -204,15 +189,27 @@ def euler12(divisors=500):
     '''
     Find the first triangular to have more than a target number of divisors
     '''
-    pass
+    # T(k) = k(k + 1) / 2 and k, k + 1 are coprime so the number of divisors
+    # of T(k) is the product of the divisor counts of its two coprime parts:
+    # k / 2 and k + 1 (k even) or k and (k + 1) / 2 (k odd).
+    bound = 1 << 12
+    while True:
+        tau = multiplicative_tables(bound + 1).tau
+        for k in range(1, bound):
+            a, b = (k // 2, k + 1) if k % 2 == 0 else (k, (k + 1) // 2)
+            if tau[a] * tau[b] > divisors:
+                return k * (k + 1) // 2
+        bound *= 2
 
 
 @euler_solution
-def euler13(str_ns):
+def euler13(str_ns, digits=10):
     '''
-    Work out the first 10 digits of the sum of 100 50-digit numbers
+    Work out the first 10 digits of the sum of 100 50-digit numbers, given
+    as a list of strings or as the name of a file with one number per line
     '''
-    pass
+    lines = read_lines(str_ns) if isinstance(str_ns, str) else str_ns
+    return leading_digits_of_sum(lines, digits)
 
 
 @euler_solution
@@ -223,34 +220,7 @@ def euler14(upper_bound=int(1e6)):
     n -> n/2    (if n is even)
     n -> 3n + 1 (if n is odd)
     '''
-    def step_forward(n):
-        '''Continue the chain'''
-        if n % 2 == 0:
-            return n // 2
-        else:
-            return (3 * n) + 1
-
-    n_to_len = {2: 2, 1: 1}
-
-    for num in range(3, upper_bound+1):
-        if n_to_len.get(num):
-            continue  # Filled in already
-
-        existing_chain = n_to_len.get(step_forward(num))
-        if existing_chain:
-            n_to_len[num] = existing_chain + 1
-        else:
-            chain = [num]
-            next_num = step_forward(num)
-            while next_num != 4:
-                chain.append(next_num)
-                next_num = step_forward(next_num)
-            for i, n in enumerate(reversed(chain)):
-                # 4 has a chain length of 3, Python indexing from 0
-                n_to_len[n] = i + 4
-
-    valid = ((k, v) for k, v in n_to_len.items() if k <= upper_bound)
-    return sorted(valid, key=lambda x: x[1], reverse=True)
+    return longest_collatz(upper_bound)
 
 
 @euler_solution
@@ -263,7 +233,7 @@ def euler15(grid_size=20):
     '''
     # This is simply Pascal's triangle and looking for the middle entry in the
     # 2 x grid_size row
-    return int(nCr(grid_size * 2, grid_size))
+    return nCr(grid_size * 2, grid_size)
 
 
 @euler_solution
@@ -290,40 +260,12 @@ def euler27(bound=1000):
     that produces the maximum number of primes for consecutive values of n,
     starting with n=0.
     '''
-    def _quad(a, b):
-        def q(n):
-            return n**2 + a * n + b
-        return q
-
-    best = None
-    best_run = []
-
-    # Starting at n=0 means that b must be prime so that cuts down
-    # the range of coefficients we need to look at.
-    for a in range(bound):
-        for b in primes_to_n(bound+1):
-            # We can have +ve and -ve coefficients
-            for a_sign in [1, -1]:
-                for b_sign in [1, -1]:
-                    A = a * a_sign
-                    B = b * b_sign
-                    func = _quad(A, B)
-
-                    n = 0
-                    k = func(n)
-                    run = []
-
-                    while probably_prime(k):
-                        run.append(k)
-                        n += 1
-                        k = func(n)
-
-                    if len(run) > len(best_run):
-                        best_run = run
-                        best = (A, B)
-                        print(
-                            f'Best so far: {best} -> {n+1} primes\n{best_run}'
-                        )
+    found = longest_quadratic_run(bound)
+    if found is None:
+        return None
+    a, b, run = found
+    return a * b
+
 
 @euler_solution
 def euler28(width=5):
@@ -376,7 +318,7 @@ def euler35(bound=100):
 
 
 @euler_solution
-def euler49():
+def euler49(digits=4, terms=3):
     '''
     The arithmetic sequence, 1487, 4817, 8147, in which each of the terms
     increases by 3330, is unusual in two ways:
@@ -388,27 +330,10 @@ def euler49():
     What 12-digit number do you form by concatenating the three terms in this
     sequence?
     '''
-    primes = primes_to_n(10000)
-
-    # partition by containing digits
-    groups = defaultdict(list)
-
-    for p in primes:
-        if p > 1000:
-            key = frozenset(str(p))
-            groups[key].append(p)
-
-    # Keep those that have at least 3 values
-    candidates = filter(lambda l: len(l) >= 3, groups.values())
-
-    # Keep those with a consistant jump
-    consistant = []
-    for c in candidates:
-        for a, b, c in combinations(c, 3):
-            if b - a == c - b:
-                consistant.append([a, b, c])
-
-    return consistant
+    return [
+        int(''.join(map(str, seq)))
+        for seq in prime_permutation_progressions(digits, terms)
+    ]
 
 
 @euler_solution
@@ -447,101 +372,8 @@ def euler54(fname='data/poker.txt'):
 
     How many hands does Player 1 win?
     '''
-    card = namedtuple('card', 'val suit')
-    val_rank = [
-        '2', '3', '4', '5', '6',
-        '7', '8', '9', 'T', 'J',
-        'Q', 'K', 'A'
-    ]
-    suit_rank = ['D', 'C', 'H', 'S']
-
-    def classify(hand):
-        '''Determine the best hand from a set of 5 cards.'''
-        hand = sorted(hand, key=lambda v: val_rank.index(v.val))
-        vals = [c.val for c in hand]
-
-        has_flush = len(set(c.suit for c in hand)) == 1
-        ix = val_rank.index(hand[0].val)
-        has_straight = vals == val_rank[ix:ix+5]
-        akind = [list(g) for _, g in groupby(hand, key=lambda c: c.val)]
-        akind = sorted(
-            [a for a in akind if len(a) > 1],
-            key=lambda a: len(a)
-        )
-
-        # Default to high card
-        score = 1
-        qualifier = val_rank.index(hand[-1].val)
-
-        if has_straight and has_flush:
-            if hand[0].val == 'T':
-                # Royal Flush
-                score = 10
-                qualifier = suit_rank.index(hand[0].suit)
-            else:
-                # Straight flush
-                score = 9
-
-        elif len(akind) == 1:
-            if len(akind[0]) == 4:
-                # Four of a kind
-                score = 8
-            elif len(akind[0]) == 3:
-                # Three of a kind
-                score = 4
-            elif len(akind[0]) == 2:
-                # Pair
-                score = 2
-
-            qualifier = val_rank.index(akind[0][0].val)
-
-        elif len(akind) == 2:
-            if len(akind[1]) == 3:
-                # Full house
-                score = 7
-            else:
-                # Two pairs
-                score = 3
-
-            qualifier = (
-                val_rank.index(akind[1][0].val),
-                val_rank.index(akind[0][0].val)
-            )
-
-        elif has_straight:
-            # Straight
-            score = 5
-
-        elif has_flush:
-            # Flush
-            score = 6
-
-        return score, qualifier
-
-    player_1_score = 0
-
-    with open(fname, 'r') as f:
-        for line in f:
-            cards = [card(*c) for c in line.strip().split()]
-            hand_1 = cards[:5]
-            hand_2 = cards[5:]
-
-            score_1, qual_1 = classify(hand_1)
-            score_2, qual_2 = classify(hand_2)
-
-            if score_1 > score_2:
-                player_1_score += 1
-            elif score_1 == score_2:
-                if score_1 in [3, 7]:
-                    # Two pairs or full house
-                    q10, q11 = qual_1
-                    q20, q21 = qual_2
-                    if q10 > q20 or (q10 == q20 and q11 > q21):
-                        player_1_score += 1
-                else:
-                    if qual_1 > qual_2:
-                        player_1_score += 1
-
+    # Every hand is mapped to a single comparable rank by a lookup table
+    player_1_score, _, _ = score_poker_file(fname)
     return player_1_score
 
 
@@ -590,7 +422,7 @@ def euler58():
 
 
 @euler_solution
-def euler60(bound=10000):
+def euler60(bound=10000, k=5):
     '''
     The primes 3, 7, 109, and 673, are quite remarkable. By taking any two
     primes and concatenating them in any order the result will always be prime.
@@ -601,49 +433,11 @@ def euler60(bound=10000):
     Find the lowest sum for a set of five primes for which any two primes
     concatenate to produce another prime.
     '''
-    def valid(nums):
-        '''
-        Check that all primes in a set concatenate with one another
-        to form new primes.
-        '''
-        return all(
-            probably_prime(int(str(a)+str(b)))
-            for a, b in itools.permutations(nums, 2)
-        )
-
-    candidates = {}
-
-    # Find pairs of primes that work
-    primes = list(primes_to_n(bound))
-
-    for ix, p in enumerate(primes):
-        pairs = []
-        for q in primes[ix:]:
-            if probably_prime(int(str(p) + str(q))):
-                pairs.append(q)
-
-        candidates[p] = set(pairs)
-
-    for k, pairs in candidates.items():
-        for p in sorted(pairs):
-            triples = pairs.intersection(candidates[p])
-            for q in sorted(triples):
-                if not valid([k, p, q]):
-                    continue
-
-                quadruples = triples.intersection(candidates[q])
-                for r in sorted(quadruples):
-                    if not valid([k, p, q, r]):
-                        continue
-
-                    print(f'Found quartet: {[k, p, q, r]}')
-
-                    quintuples = quadruples.intersection(candidates[r])
-                    for s in sorted(quintuples):
-                        nums = [k, p, q, r, s]
-                        if valid(nums):
-                            return nums, sum(nums)
-    print('No candidate found')
+    found = min_sum_prime_clique(k, bound)
+    if found is None:
+        return None
+    total, nums = found
+    return nums, total
 
 
 @euler_solution
@@ -657,30 +451,161 @@ def euler62(seed=1, target=5):
     Find the smallest cube for which exactly five permutations of its digits
     are cube.
     '''
-    def all_cubes(seed):
-        k = seed
-        yield k ** 3
-        while True:
-            k += 1
-            yield k ** 3
+    # Permutations of a cube have the same number of digits so each digit
+    # length is counted on its own and then thrown away
+    for digits, bases in powers_by_length(3, seed):
+        counts = Counter(digit_signature(k ** 3) for k in bases)
+        if target not in counts.values():
+            continue
+        for k in bases:
+            if counts[digit_signature(k ** 3)] == target:
+                return k ** 3
 
-    perms = defaultdict(list)
-    max_perms = 1
-    required_digits = None
 
-    for c in all_cubes(seed):
-        digits = tuple(sorted(str(c)))
-        if required_digits is not None:
-            if len(digits) > required_digits:
-                # We have the minimum by now
-                break
+###############################################################################
+# Batch runner #
+################
+def solution_numbers():
+    '''
+    The problem numbers of every eulerN function defined in this module
+    '''
+    pattern = re.compile(r'euler(\d+)$')
+    matches = (pattern.match(name) for name in globals())
+    return sorted(int(m.group(1)) for m in matches if m)
+
+
+def accepts_arguments(n, args):
+    '''
+    Check that eulerN can be called with args, i.e. that every parameter
+    without a default has a value
+    '''
+    try:
+        inspect.signature(globals()[f'euler{n}']).bind(*args)
+    except TypeError:
+        return False
+    return True
+
+
+def main(argv=None):
+    '''
+    Run a selection of solutions in parallel, printing each result as soon
+    as it is available.
+
+        python solutions.py                 # everything
+        python solutions.py 1 7 14 -j 4     # selected problems on 4 cores
+        python solutions.py 14 -a 14=100000 # override the arguments
+
+    With --bench each problem is benchmarked (one at a time unless -j is
+    given) and the summaries can be saved as JSON or compared against a
+    previously saved baseline. Shared prime tables are rebuilt for every
+    run unless --warm is given.
+
+        python solutions.py --bench --save baseline.json
+        python solutions.py --bench --compare baseline.json
+    '''
+    parser = argparse.ArgumentParser(description='Run Project Euler solutions')
+    parser.add_argument(
+        'problems', nargs='*', type=int,
+        help='problem numbers to run (default: all of them)'
+    )
+    parser.add_argument(
+        '-a', '--args', action='append', default=[], metavar='N=ARGS',
+        help='arguments for problem N as Python literals, e.g. 1=3,5,1000'
+    )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=None,
+        help='number of problems to run at once (default: one per core)'
+    )
+    parser.add_argument(
+        '-t', '--timeout', type=float, default=60,
+        help='seconds to allow each problem before it is killed'
+    )
+    parser.add_argument(
+        '--bench', action='store_true',
+        help='benchmark each problem rather than running it once'
+    )
+    parser.add_argument(
+        '--warm', action='store_true',
+        help='keep shared prime tables between benchmark runs'
+    )
+    parser.add_argument(
+        '--save', metavar='FILE',
+        help='write benchmark summaries to FILE as JSON'
+    )
+    parser.add_argument(
+        '--compare', metavar='FILE',
+        help='flag regressions against benchmark summaries saved in FILE'
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=0.05,
+        help='relative slow down counted as a regression (default: 0.05)'
+    )
+    opts = parser.parse_args(argv)
+    if (opts.save or opts.compare or opts.warm) and not opts.bench:
+        parser.error('--save, --compare and --warm require --bench')
+
+    known = solution_numbers()
+    problems = opts.problems or known
+    unknown = sorted(set(problems) - set(known))
+    if unknown:
+        parser.error(f'no solution for problem(s): {unknown}')
+
+    problem_args = dict(DEFAULT_ARGS)
+    for spec in opts.args:
+        n, _, literal = spec.partition('=')
+        try:
+            n = int(n)
+            args = ast.literal_eval(literal) if literal else ()
+        except (ValueError, SyntaxError):
+            parser.error(f'bad --args value {spec!r}: expected N=LITERALS')
+        problem_args[n] = args if isinstance(args, tuple) else (args,)
+
+    tasks = []
+    for n in problems:
+        args = problem_args.get(n, ())
+        if accepts_arguments(n, args):
+            tasks.append((f'euler{n}', args))
+        else:
+            # e.g. problems that need an input grid: supply one with -a
+            print(f'{f"euler{n}":<10} skipped   no arguments, use -a {n}=...')
+    jobs, bench = opts.jobs, None
+    if opts.bench:
+        # Concurrent benchmarks would compete for cores and skew each other
+        jobs = jobs or 1
+        bench = {'max_seconds': opts.timeout / 2, 'cold': not opts.warm}
+
+    failed = 0
+    summaries = {}
+    for res in run_solutions('solutions', tasks, jobs, opts.timeout, bench):
+        failed += res.status != 'ok'
+        if bench and res.status == 'ok':
+            summaries[res.name] = stats = res.value
+            print(
+                f'{res.name:<10} runs={stats["runs"]:<5} '
+                f'min={stats["min"] / 1e6:.3f}ms '
+                f'median={stats["median"] / 1e6:.3f}ms '
+                f'iqr={stats["iqr"] / 1e6:.3f}ms '
+                f'ci95=±{stats["ci95"] / 1e6:.3f}ms'
+            )
+        else:
+            print(
+                f'{res.name:<10} {res.status:<8} '
+                f'{res.seconds:9.4f}s  {res.value}'
+            )
 
-        perms[digits].append(c)
+    if opts.save:
+        save_benchmarks(summaries, opts.save)
+    if opts.compare:
+        baseline = load_benchmarks(opts.compare)
+        regressions = list(
+            compare_benchmarks(baseline, summaries, opts.threshold)
+        )
+        for name, ratio in regressions:
+            print(f'REGRESSION {name}: median is {ratio:.2f}x the baseline')
+        failed += len(regressions)
 
-        if len(perms[digits]) > max_perms:
-            max_perms = len(perms[digits])
+    return 1 if failed else 0
 
-            if max_perms == target:
-                required_digits = len(digits)
 
-    return min([min(v) for v in perms.values() if len(v) == target])
+if __name__ == '__main__':
+    sys.exit(main())